@@ -0,0 +1,108 @@
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from historico import ROTULOS
+from variacoes import variacoes
+
+# -------------------------
+# CONFIG
+# -------------------------
+# |z robusto| acima disso marca o mês como atípico
+LIMIAR_Z = float(os.environ.get("DASHBOARD_LIMIAR_ANOMALIA", "3.5"))
+# séries com menos meses que isso não são avaliadas
+MINIMO_MESES = 4
+# desvios menores que isso (R$) não são marcados, mesmo com z alto
+VALOR_MINIMO = float(os.environ.get("DASHBOARD_VALOR_MINIMO_ANOMALIA", "1000"))
+MESES_ANO = 12
+# MAD -> desvio padrão (distribuição normal)
+ESCALA_MAD = 1.4826
+# escalas abaixo de um centavo são só ruído de arredondamento
+ESCALA_MINIMA = 0.01
+
+# séries por código (Ação - Código x Fonte); as descrições são só rótulos
+NIVEL_PADRAO = ("acao_codigo", "fonte_codigo")
+
+# -------------------------
+# PAINEL SÉRIES x MESES
+# -------------------------
+# Fluxos mensais (variacoes.py) de cada combinação do nível em uma matriz
+# n_series x n_meses, NaN onde a série não aparece no mês
+def painel(fluxos, nivel):
+    nivel = list(nivel)
+    ids = fluxos.groupby(nivel, dropna=False, sort=False, observed=True).ngroup().to_numpy()
+    primeiras = np.unique(ids, return_index=True)[1]
+    chaves = fluxos[nivel].iloc[primeiras].reset_index(drop=True)
+    meses, colunas = np.unique(fluxos["mes"].to_numpy(), return_inverse=True)
+    Y = np.full((len(chaves), len(meses)), np.nan)
+    Y[ids, colunas] = fluxos["fluxo"].to_numpy(dtype=float)
+    return chaves, pd.DatetimeIndex(meses), Y
+
+# -------------------------
+# Z-SCORE ROBUSTO (MEDIANA / MAD)
+# -------------------------
+# Vetorizado sobre todas as séries. Com dois anos ou mais, a referência de
+# cada mês é a mediana do mesmo mês nos outros anos (resíduo sazonal);
+# antes disso, a mediana da série. Séries com MAD zero usam o desvio médio
+# absoluto como escala.
+def z_robusto(Y, meses, sazonal=True):
+    # séries sem nenhum valor geram avisos de "mediana de vazio": ignorados
+    with warnings.catch_warnings(), np.errstate(all="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return _z_robusto(np.asarray(Y, dtype=float), meses, sazonal)
+
+def _z_robusto(Y, meses, sazonal):
+    referencia = np.broadcast_to(np.nanmedian(Y, axis=1, keepdims=True), Y.shape).copy()
+    if sazonal and len(meses) >= 2 * MESES_ANO:
+        for m in range(1, MESES_ANO + 1):
+            cols = np.flatnonzero(meses.month == m)
+            if len(cols) >= 2:
+                referencia[:, cols] = np.nanmedian(Y[:, cols], axis=1, keepdims=True)
+
+    residuo = Y - referencia
+    mad = np.nanmedian(np.abs(residuo - np.nanmedian(residuo, axis=1, keepdims=True)), axis=1) * ESCALA_MAD
+    media_abs = np.nanmean(np.abs(residuo), axis=1) * np.sqrt(np.pi / 2)
+    escala = np.where(mad > ESCALA_MINIMA, mad, media_abs)
+    z = np.divide(residuo, escala[:, None], out=np.zeros_like(residuo), where=escala[:, None] > ESCALA_MINIMA)
+    return np.where(np.isnan(Y), np.nan, z), referencia
+
+# -------------------------
+# DETECÇÃO
+# -------------------------
+# código -> descrição do mês mais recente em que aparece
+def descricoes(tabela, dim):
+    ultimas = tabela[["mes", dim, ROTULOS[dim]]].dropna(subset=[dim]).sort_values("mes", kind="stable")
+    ultimas = ultimas.drop_duplicates(dim, keep="last")
+    return pd.Series(ultimas[ROTULOS[dim]].to_numpy(), index=ultimas[dim].to_numpy())
+
+# Meses atípicos de cada série do nível (padrão: código da ação x código
+# da fonte), do maior para o menor |z|; códigos ganham a descrição ao lado
+def detectar_anomalias(tabela, nivel=NIVEL_PADRAO, metrica="pago", limiar=LIMIAR_Z,
+                       valor_minimo=VALOR_MINIMO, minimo_meses=MINIMO_MESES, origem=None):
+    nivel = list(nivel)
+    fluxos = variacoes(tabela, nivel, metrica, origem)
+    rotulos = [ROTULOS[d] for d in nivel if d in ROTULOS and ROTULOS[d] not in nivel]
+    colunas = nivel + rotulos + ["mes", "fluxo", "referencia", "desvio", "z"]
+    if fluxos.empty:
+        return pd.DataFrame(columns=colunas)
+
+    chaves, meses, Y = painel(fluxos, nivel)
+    z, referencia = z_robusto(Y, meses)
+    desvio = Y - referencia
+    validos = (~np.isnan(Y)).sum(axis=1) >= minimo_meses
+    marcados = validos[:, None] & (np.abs(np.nan_to_num(z)) > limiar) & (np.abs(np.nan_to_num(desvio)) >= valor_minimo)
+
+    linhas, cols = np.nonzero(marcados)
+    resultado = chaves.iloc[linhas].reset_index(drop=True)
+    resultado["mes"] = meses[cols]
+    resultado["fluxo"] = Y[linhas, cols]
+    resultado["referencia"] = referencia[linhas, cols]
+    resultado["desvio"] = desvio[linhas, cols]
+    resultado["z"] = z[linhas, cols]
+    for dim in nivel:
+        if ROTULOS.get(dim) in rotulos:
+            resultado[ROTULOS[dim]] = resultado[dim].map(descricoes(tabela, dim))
+    ordem = np.argsort(-np.abs(resultado["z"].to_numpy()), kind="stable")
+    return resultado.iloc[ordem].reset_index(drop=True)[colunas]
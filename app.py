@@ -1,45 +1,77 @@
+import time
+_inicio_script = time.perf_counter()
+
 import streamlit as st
 import pandas as pd
-import unicodedata
 import os
-import plotly.express as px
-from prophet import Prophet
-import glob
-from datetime import datetime
+import uuid
+
+import compartilhado
+from carregamento import mapear_colunas, normalize
+from consultas import obter_consultas
+from cubo import obter_indice
+from desempenho import ARQUIVO_METRICAS, aquecer_em_segundo_plano, inicializacao, medir, metricas
+from detalhes import TAMANHOS_PAGINA, obter_tabela
+from graficos import arredondar, top_n_outros
+from graficos import cache as cache_figuras
+from historico import ler_historico, listar_arquivos, serie_previsao
+from pacote import abrir_pacote
+from registro import PASTA_DADOS, registro
+from streaming import MODO_GRANDE_MB, arquivo_grande
+from vigia import iniciar_vigia
+from variacoes import METRICAS, NOMES_NIVEIS, variacoes
+from anomalias import LIMIAR_Z, NIVEL_PADRAO, detectar_anomalias
+from previsao import PREVISOR, agendar_catalogo, prever
+
+# plotly e prophet são importados só quando usados (ver abaixo)
+inicializacao.marcar("importações", _inicio_script)
 
 # -------------------------
 # CONFIG
 # -------------------------
 st.set_page_config(page_title="Dashboard de Despesas", layout="wide")
 
+# métricas de desempenho (desempenho.py): etapas desta execução contam para
+# a sessão e para o total do processo; ?admin=1 mostra a aba de desempenho
+if "sessao_metricas" not in st.session_state:
+    st.session_state["sessao_metricas"] = uuid.uuid4().hex[:8]
+metricas.iniciar_sessao(st.session_state["sessao_metricas"])
+modo_admin = st.query_params.get("admin") == "1"
+
+# entidade e exercício: partições de dados/<entidade>/<ano>/ (registro.py)
+entidades = registro.entidades()
+if not entidades:
+    st.error(f"Nenhum relatório encontrado em {PASTA_DADOS}")
+    st.stop()
+
+entidade = st.sidebar.selectbox("Entidade", entidades)
+ano = st.sidebar.selectbox("Ano", registro.anos(entidade))
+particao = registro.particao(entidade, ano)
+
 # caminho do arquivo
-ARQUIVO = "dados/Relatorio.txt" 
+ARQUIVO = particao.arquivo
+PASTA_HISTORICO = particao.pasta_historico
 
 # -------------------------
 # FUNÇÕES AUXILIARES
 # -------------------------
-def normalize(col: str) -> str:
-    if not isinstance(col, str):
-        return col
-    s = unicodedata.normalize("NFKD", col)
-    s = s.encode("ascii", "ignore").decode("ascii")
-    s = s.lower().strip()
-    s = s.replace(" - ", " ").replace("-", " ").replace("/", " ").replace(".", "")
-    s = " ".join(s.split())
-    return s
-
-def find_col(df_cols, target_norm):
-    for c in df_cols:
-        if normalize(c) == target_norm:
-            return c
-    return None
-
 def fmt_real(v):
     try:
         return f"R$ {v:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
     except:
         return "R$ 0,00"
 
+# figuras saem do cache (graficos.py) quando dados e opções não mudaram;
+# o tamanho do JSON de cada gráfico aparece na barra lateral
+tamanhos_graficos = {}
+
+def grafico(nome, dados, opcoes, construir):
+    with medir(f"figura: {nome}"):
+        fig, tamanho = cache_figuras.obter(dados, dict(opcoes, titulo=nome), construir)
+    tamanhos_graficos[nome] = tamanho
+    with medir(f"st.plotly_chart: {nome}"):
+        st.plotly_chart(fig, use_container_width=True)
+
 # -------------------------
 # LEITURA DO ARQUIVO
 # -------------------------
@@ -47,74 +79,82 @@ if not os.path.exists(ARQUIVO):
     st.error(f"Arquivo não encontrado: {ARQUIVO}")
     st.stop()
 
-df = pd.read_csv(ARQUIVO, sep=";", encoding="latin1", quotechar='"')
-df.columns = [c.strip() for c in df.columns]
+# leitura, mapeamento e conversão numérica ficam em cache (carregamento.py),
+# compartilhado entre sessões e renovado só quando o arquivo muda; partições
+# ociosas saem da memória
+_inicio_leitura = time.perf_counter()
+# modo arquivo grande (streaming.py): o relatório é lido em blocos e só os
+# agregados ficam em memória; sem linhas, não há tabela detalhada
+modo_grande = arquivo_grande(ARQUIVO)
+
+# pacote pré-calculado (python cli.py pacote): enquanto estiver em dia com
+# os arquivos, agregados, filtros, histórico e previsões são só lidos dele
+pacote = abrir_pacote(particao.pasta_pacote)
+if pacote is not None and not pacote.confere(ARQUIVO, PASTA_HISTORICO):
+    pacote = None
+
+if modo_grande:
+    # barra de progresso só quando o arquivo é de fato lido (não no cache)
+    _barra = []
+
+    def _progresso(fracao):
+        if not _barra:
+            _barra.append(st.progress(0.0))
+        _barra[0].progress(fracao, text=f"Lendo o relatório em blocos... {fracao:.0%}")
+
+    with medir("leitura relatório") as _m:
+        agregados = registro.agregar(particao, progresso=_progresso)
+        _m["linhas"] = agregados.vazao["linhas"]
+    for b in _barra:
+        b.empty()
+    df = None
+elif pacote is not None:
+    # com o pacote, as linhas do relatório só são lidas para a tabela
+    # detalhada (lá embaixo, depois de filtros, cards e gráficos)
+    registro.marcar_acesso(particao)
+    registro.despejar_ociosas()
+    df = None
+else:
+    with medir("leitura relatório") as _m:
+        df = registro.carregar(particao)
+        _m["linhas"] = len(df)
+inicializacao.marcar("leitura", _inicio_leitura)
 
 # -------------------------
 # MAPEAMENTO DE COLUNAS
 # -------------------------
-expected = {
-    "orcado inicial": None,
-    "orcado atualizado": None,
-    "empenhado no mes": None,
-    "empenhado ate o mes": None,
-    "liquidado no mes": None,
-    "liquidado ate o mes": None,
-    "pago no mes": None,
-    "pago ate o mes": None,
-    "funcao descricao": None,
-    "subfuncao descricao": None,
-    "descricao categoria economica": None,
-    "orgao": None,
-}
-
-for k in list(expected.keys()):
-    expected[k] = find_col(df.columns, k)
+if modo_grande:
+    expected = agregados.expected
+elif pacote is not None:
+    expected = pacote.manifesto["colunas"]
+else:
+    expected = mapear_colunas(df.columns)
 
-# -------------------------
-# CONVERSÃO NUMÉRICA
-# -------------------------
-numeric_cols_norm = [
-    "orcado inicial", "orcado atualizado",
-    "empenhado no mes", "empenhado ate o mes",
-    "liquidado no mes", "liquidado ate o mes",
-    "pago no mes", "pago ate o mes"
-]
-
-for ncol in numeric_cols_norm:
-    orig = expected.get(ncol)
-    if orig is None or orig not in df.columns:
-        continue
-
-    series = df[orig].astype(str).str.strip()
-    sample = series.dropna().astype(str).head(20).tolist()
-    uses_comma_decimal = any(
-        ((',' in s) and (s.count(',') >= 1) and (s[-3] == ',' or s[-2] == ','))
-        for s in sample if s and s not in ['nan', 'None']
-    )
-    if uses_comma_decimal:
-        series = series.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
-
-    df[orig] = pd.to_numeric(series, errors="coerce").fillna(0.0)
+def prever_tela(serie, dimensao, valor):
+    previsao = pacote.previsao(dimensao, valor) if pacote is not None else None
+    return previsao if previsao is not None else prever(serie, periodos=2)
 
 
 # --- LOGO E TÍTULO ---
 col_logo, col_titulo = st.columns([1, 5])
 with col_logo:
-    st.image("logo.png", width=150) 
+    st.image(particao.logo if os.path.exists(particao.logo) else "logo.png", width=150) 
 with col_titulo:
     st.markdown(
-    """
+    f"""
     <h1 style='text-align: center; margin-top: 10px; color: #2c3e50;
                text-shadow: 1px 1px 2px rgba(0,0,0,0.2);'>
-        Dashboard Contas Públicas Guaramirim
+        Dashboard Contas Públicas {entidade} {ano}
     </h1>
     """,
     unsafe_allow_html=True
 )
 
 st.markdown("---")
-aba_dashboard, aba_previsoes = st.tabs(["📊 Dashboard", "📈 Previsões"])
+if modo_admin:
+    aba_dashboard, aba_previsoes, aba_desempenho = st.tabs(["📊 Dashboard", "📈 Previsões", "🛠️ Desempenho"])
+else:
+    aba_dashboard, aba_previsoes = st.tabs(["📊 Dashboard", "📈 Previsões"])
 
 with aba_dashboard:
     # -------------------------
@@ -128,55 +168,66 @@ with aba_dashboard:
     subfunc_col = expected.get("subfuncao descricao")
     cat_col = expected.get("descricao categoria economica")
 
-    # Garante que as colunas existem
-    df_filtros = df.copy()
+    # opções dependentes e linhas filtradas saem do índice pré-calculado
+    # (cubo.py): hierarquia de valores + posições das linhas de cada valor
+    # (no modo arquivo grande e com o pacote, sobre as células do cubo)
+    _inicio_filtros = time.perf_counter()
+    if modo_grande:
+        base_filtros = agregados.cubo.celulas
+    elif pacote is not None:
+        base_filtros = pacote.cubo.celulas
+    else:
+        base_filtros = df
+    indice = obter_indice(base_filtros, [func_col, subfunc_col, cat_col])
+    selecao = {}
 
     # === FILTRO 1: FUNÇÃO ===
-    func_options = sorted(df_filtros[func_col].dropna().unique()) if func_col in df_filtros.columns else []
+    func_options = indice.opcoes(func_col)
     with col1:
         func_sel = st.selectbox("Função", ["Todas"] + func_options) if func_options else "Todas"
 
     if func_sel != "Todas":
-        df_filtros = df_filtros[df_filtros[func_col] == func_sel]
+        selecao[func_col] = func_sel
 
     # === FILTRO 2: SUBFUNÇÃO (dependente da função) ===
-    subfunc_options = (
-        sorted(df_filtros[subfunc_col].dropna().unique())
-        if subfunc_col in df_filtros.columns else []
-    )
+    subfunc_options = indice.opcoes(subfunc_col, selecao)
     with col2:
         subfunc_sel = st.selectbox("Subfunção", ["Todas"] + subfunc_options) if subfunc_options else "Todas"
 
     if subfunc_sel != "Todas":
-        df_filtros = df_filtros[df_filtros[subfunc_col] == subfunc_sel]
+        selecao[subfunc_col] = subfunc_sel
 
     # === FILTRO 3: CATEGORIA ECONÔMICA (dependente dos anteriores) ===
-    cat_options = (
-        sorted(df_filtros[cat_col].dropna().unique())
-        if cat_col in df_filtros.columns else []
-    )
+    cat_options = indice.opcoes(cat_col, selecao)
     with col3:
         cat_sel = st.selectbox("Categoria Econômica", ["Todas"] + cat_options) if cat_options else "Todas"
 
     if cat_sel != "Todas":
-        df_filtros = df_filtros[df_filtros[cat_col] == cat_sel]
+        selecao[cat_col] = cat_sel
 
-    df_filtrado = df.copy()
-    if func_col in df.columns and func_sel != "Todas":
-        df_filtrado = df_filtrado[df_filtrado[func_col] == func_sel]
-    if subfunc_col in df.columns and subfunc_sel != "Todas":
-        df_filtrado = df_filtrado[df_filtrado[subfunc_col] == subfunc_sel]
-    if cat_col in df.columns and cat_sel != "Todas":
-        df_filtrado = df_filtrado[df_filtrado[cat_col] == cat_sel]
+    linhas_sel = indice.linhas(selecao)
+    metricas.registrar("filtros", time.perf_counter() - _inicio_filtros, indice.total_linhas if linhas_sel is None else len(linhas_sel))
 
     # -------------------------
     # CÁLCULOS
     # -------------------------
+    # totais, ranking e gráficos saem da API de consultas (consultas.py):
+    # cubo pré-agregado em pandas ou DuckDB sobre a cópia colunar
+    if pacote is not None:
+        consultas = pacote.consultas()
+    elif modo_grande:
+        consultas = agregados.consultas
+    else:
+        consultas = obter_consultas(df, ARQUIVO, expected)
+    with medir("consulta: totais"):
+        # sem filtro, os totais já vêm prontos no pacote (agregados.json)
+        if pacote is not None and not selecao:
+            totais_sel = pacote.agregados["totais"]
+        else:
+            totais_sel = consultas.totais(selecao)
+
     def get_sum(norm_name):
-        orig = expected.get(norm_name)
-        if orig and orig in df_filtrado.columns:
-            return df_filtrado[orig].sum()
-        return 0.0
+        return totais_sel.get(expected.get(norm_name), 0.0)
 
     totais = {
         "Orçado Inicial": get_sum("orcado inicial"),
@@ -263,6 +314,11 @@ with aba_dashboard:
     # GRÁFICO PRINCIPAL (ordenado)
     # -------------------------
     st.divider()
+
+    # plotly só é importado aqui: filtros e cards acima já foram enviados
+    _inicio_plotly = time.perf_counter()
+    import plotly.express as px
+    inicializacao.marcar("importação plotly", _inicio_plotly)
     
 
     st.markdown("##### 🥉 Top 3 Por Função")
@@ -270,10 +326,13 @@ with aba_dashboard:
     group_col = func_col
     
 
-    if group_col and group_col in df_filtrado.columns:
+    if group_col and group_col in consultas.dimensoes:
         col_base = expected.get("pago ate o mes")
-        graf_top_3 = df_filtrado.groupby(group_col)[col_base].sum().reset_index()
-        graf_top_3 = graf_top_3.sort_values(col_base, ascending=False)
+        with medir("consulta: top 3"):
+            if pacote is not None and not selecao and "top3" in pacote.agregados:
+                graf_top_3 = pd.DataFrame(pacote.agregados["top3"])
+            else:
+                graf_top_3 = consultas.top_n(group_col, col_base, 3, selecao)
         icons_rank = ["🥇", "🥈", "🥉"]
         colors_rank = ["#DAA520", "#C0C0C0", "#CD7F32"]  # ouro, prata, bronze
         top3 = graf_top_3.head(3)
@@ -301,30 +360,33 @@ with aba_dashboard:
         st.markdown("### 📈 Execução Financeira por Função")
 
         y_cols = [expected.get(n) for n in ["empenhado ate o mes", "liquidado ate o mes", "pago ate o mes"] if expected.get(n)]
-        graf_df = df_filtrado.groupby(group_col)[y_cols].sum().reset_index()
+        with medir("consulta: por função"):
+            graf_df = consultas.por_funcao(selecao, y_cols)
         graf_df["Total"] = graf_df[y_cols].sum(axis=1)
-        graf_df = graf_df.sort_values("Total", ascending=False)
-
-        fig = px.bar(
-        graf_df,
-        x=group_col,
-        y=y_cols,
-        barmode="group",
-        title="Execução Financeira por Função",
-        labels={"variable": "Indicador"} 
-    )
-
-        fig.update_layout(
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.02,
-                xanchor="center",
-                x=0.5
-            )
+        graf_df = arredondar(graf_df.sort_values("Total", ascending=False)[[group_col] + y_cols])
+
+        def barras_funcao(graf_df):
+            fig = px.bar(
+            graf_df,
+            x=group_col,
+            y=y_cols,
+            barmode="group",
+            title="Execução Financeira por Função",
+            labels={"variable": "Indicador"} 
         )
 
-        st.plotly_chart(fig, use_container_width=True)
+            fig.update_layout(
+                legend=dict(
+                    orientation="h",
+                    yanchor="bottom",
+                    y=1.02,
+                    xanchor="center",
+                    x=0.5
+                )
+            )
+            return fig
+
+        grafico("Execução Financeira por Função", graf_df, {"x": group_col, "y": tuple(y_cols)}, barras_funcao)
     else:
         st.warning("Coluna de função não encontrada — gráfico não exibido.")
 
@@ -346,32 +408,29 @@ with aba_dashboard:
         sel_col = expected.get(normalize(metrica_sel))
         subfunc_col = expected.get("subfuncao descricao")
 
-        if sel_col and subfunc_col and sel_col in df_filtrado.columns:
-            pie_df = df_filtrado.groupby(subfunc_col)[sel_col].sum().reset_index()
-            pie_df = pie_df.sort_values(sel_col, ascending=False)
-
-            # Pega top 5 e agrupa o resto como "Outros"
-            top5 = pie_df.head(5)
-            outros_valor = pie_df[sel_col].iloc[5:].sum()
-            if outros_valor > 0:
-                outros_df = pd.DataFrame({subfunc_col: ["Outros"], sel_col: [outros_valor]})
-                pie_df = pd.concat([top5, outros_df], ignore_index=True)
-
-            fig_pie = px.pie(
-                pie_df,
-                names=subfunc_col,
-                values=sel_col,
-                hole=0.5,
-                title=f"{metrica_sel} por Subfunção (Top 5 + Outros)"
+        if sel_col in consultas.medidas and subfunc_col in consultas.dimensoes:
+            # top 5 + "Outros"
+            with medir("consulta: por subfunção"):
+                pie_df = arredondar(top_n_outros(consultas.agregar(subfunc_col, [sel_col], selecao), subfunc_col, sel_col, 5))
+
+            def rosca_subfuncao(pie_df):
+                fig_pie = px.pie(
+                    pie_df,
+                    names=subfunc_col,
+                    values=sel_col,
+                    hole=0.5,
+                    title=f"{metrica_sel} por Subfunção (Top 5 + Outros)"
+                )
+                fig_pie.update_traces(
+                textinfo="label+percent+value",
+                textposition="outside",
+                textfont=dict(size=12),
+                pull=[0.02] * len(pie_df),  # dá um leve destaque aos segmentos
+                showlegend=False
             )
-            fig_pie.update_traces(
-            textinfo="label+percent+value",
-            textposition="outside",
-            textfont=dict(size=12),
-            pull=[0.02] * len(pie_df),  # dá um leve destaque aos segmentos
-            showlegend=False
-        )
-            st.plotly_chart(fig_pie, use_container_width=True)
+                return fig_pie
+
+            grafico("Rosca por Subfunção", pie_df, {"metrica": metrica_sel, "coluna": sel_col}, rosca_subfuncao)
         else:
             st.info("Não foi possível gerar o gráfico de rosca por Subfunção.")
 
@@ -395,51 +454,37 @@ with aba_dashboard:
         sel_cat = expected.get(normalize(metrica_sel_cat))
         categoria_col = expected.get("descricao categoria economica")
 
-        if sel_cat and categoria_col and sel_cat in df_filtrado.columns:
-            cat_df = df_filtrado.groupby(categoria_col)[sel_cat].sum().reset_index()
-            cat_df = cat_df.sort_values(sel_cat, ascending=False)
-
-            # Pega top 5 e agrupa o resto como "Outros"
-            top5 = cat_df.head(5)
-            outros_valor = cat_df[sel_cat].iloc[5:].sum()
-            if outros_valor > 0:
-                outros_df = pd.DataFrame({categoria_col: ["Outros"], sel_cat: [outros_valor]})
-                cat_df = pd.concat([top5, outros_df], ignore_index=True)
-
-            fig_cat = px.pie(
-                cat_df,
-                names=categoria_col,
-                values=sel_cat,
-                hole=0.5,
-                title=f"{metrica_sel} por Categoria Economica (Top 5 + Outros)"
-            )
-            fig_cat.update_traces(
-            textinfo="label",
-            textposition="outside",
-            textfont=dict(size=12),
-        )
-
-            fig_cat.update_traces(
-            textinfo="label",
-            textposition="outside",
-            textfont=dict(size=12)
-        )
-            fig_cat.update_traces(
-                textinfo="percent+value",
-                textposition="inside"
-            )
+        if sel_cat in consultas.medidas and categoria_col in consultas.dimensoes:
+            # top 5 + "Outros"
+            with medir("consulta: por categoria"):
+                cat_df = arredondar(top_n_outros(consultas.agregar(categoria_col, [sel_cat], selecao), categoria_col, sel_cat, 5))
+
+            def rosca_categoria(cat_df):
+                fig_cat = px.pie(
+                    cat_df,
+                    names=categoria_col,
+                    values=sel_cat,
+                    hole=0.5,
+                    title=f"{metrica_sel} por Categoria Economica (Top 5 + Outros)"
+                )
+                fig_cat.update_traces(
+                    textinfo="percent+value",
+                    textposition="inside",
+                    textfont=dict(size=12),
+                )
 
-            fig_cat.update_layout(
-                legend=dict(
-                    orientation="h",
-                    yanchor="bottom",
-                    y=1,
-                    xanchor="center",
-                    x=0.5
+                fig_cat.update_layout(
+                    legend=dict(
+                        orientation="h",
+                        yanchor="bottom",
+                        y=1,
+                        xanchor="center",
+                        x=0.5
+                    )
                 )
-            )
+                return fig_cat
 
-            st.plotly_chart(fig_cat, use_container_width=True)
+            grafico("Rosca por Categoria Econômica", cat_df, {"metrica": metrica_sel, "coluna": sel_cat}, rosca_categoria)
         else:
             st.info("Não foi possível gerar o gráfico de rosca por Categoria Economica.")
 
@@ -448,112 +493,149 @@ with aba_dashboard:
     # -------------------------
     st.divider()
     st.markdown("### 📋 Dados Detalhados")
-    st.dataframe(df_filtrado, use_container_width=True)
+
+    if modo_grande:
+        vazao = agregados.vazao
+        st.info(
+            f"Arquivo grande (a partir de {MODO_GRANDE_MB:.0f} MB): lido em {vazao['blocos']} blocos, "
+            f"{vazao['linhas']} linhas em {vazao['segundos']:.1f}s ({vazao['linhas_s']:.0f} linhas/s, "
+            f"{vazao['mb_s']:.1f} MB/s). Só os agregados ficam em memória; a tabela detalhada não está disponível."
+        )
+    else:
+        # com o pacote, o relatório é lido (ou vem do cache) só aqui, e as
+        # linhas da seleção saem do índice sobre as linhas, não sobre o cubo
+        if df is None:
+            with medir("leitura relatório") as _m:
+                df = registro.carregar(particao)
+                _m["linhas"] = len(df)
+            linhas_sel = obter_indice(df, [func_col, subfunc_col, cat_col]).linhas(selecao)
+
+        # busca, ordenação e paginação no servidor (detalhes.py): só a página
+        # visível e as colunas escolhidas vão para o navegador
+        tabela = obter_tabela(df)
+        col_busca, col_ordem, col_sentido = st.columns([2, 2, 1])
+        with col_busca:
+            busca = st.text_input("Buscar", placeholder="Texto ou código em qualquer coluna", key="busca_detalhes")
+        with col_ordem:
+            ordenar_por = st.selectbox("Ordenar por", ["(ordem do arquivo)"] + tabela.colunas, key="ordem_detalhes")
+        with col_sentido:
+            decrescente = st.toggle("Decrescente", key="sentido_detalhes")
+        colunas_sel = st.multiselect("Colunas", tabela.colunas, default=tabela.colunas, key="colunas_detalhes")
+
+        with medir("tabela detalhada: busca e ordenação") as _m:
+            posicoes = tabela.consultar(
+                linhas_sel, tuple(selecao.items()), busca,
+                ordenar_por if ordenar_por in tabela.colunas else None, decrescente,
+            )
+            _m["linhas"] = len(posicoes)
+        total_linhas = len(posicoes)
+
+        col_tamanho, col_pagina, col_info = st.columns([1, 1, 3])
+        with col_tamanho:
+            tamanho = st.selectbox("Linhas por página", TAMANHOS_PAGINA, index=1, key="tamanho_detalhes")
+        paginas = max(1, -(-total_linhas // tamanho))
+        with col_pagina:
+            pagina = st.number_input("Página", min_value=1, max_value=paginas, value=1, step=1, key="pagina_detalhes")
+        pagina = min(int(pagina), paginas)
+        with col_info:
+            inicio_pag = (pagina - 1) * tamanho
+            st.caption(f"Linhas {min(inicio_pag + 1, total_linhas)}–{min(inicio_pag + tamanho, total_linhas)} de {total_linhas} · página {pagina} de {paginas}")
+
+        with medir("st.dataframe: detalhes", tamanho):
+            st.dataframe(tabela.pagina(posicoes, pagina, tamanho, colunas_sel), use_container_width=True)
+
+        # o CSV completo só é gerado (em blocos) quando o botão é clicado
+        st.download_button(
+            "⬇️ Baixar resultado completo (CSV)",
+            data=lambda: tabela.arquivo_csv(posicoes, colunas_sel),
+            file_name="dados_detalhados.csv",
+            mime="text/csv",
+            on_click="ignore",
+        )
 
 with aba_previsoes:
     st.markdown("## 📈 Previsão de Gastos")
 
-    pasta_historico = "dados/historico" 
+    pasta_historico = PASTA_HISTORICO
 
-    arquivos = sorted(glob.glob(os.path.join(pasta_historico, "*.txt")))
+    arquivos = listar_arquivos(pasta_historico)
 
     if not arquivos:
         st.warning("Nenhum arquivo encontrado na pasta de histórico.")
     else:
-        # Função auxiliar para mapear mês/ano do nome do arquivo
-        def extrair_mes_ano(nome_arquivo):
-            nome = os.path.basename(nome_arquivo).split(".")[0]
-            meses = {
-                "Jan": 1, "Fev": 2, "Mar": 3, "Abr": 4, "Mai": 5, "Jun": 6,
-                "Jul": 7, "Ago": 8, "Set": 9, "Out": 10, "Nov": 11, "Dez": 12
-            }
-            mes = nome[:3].capitalize()
-            ano = int("20" + nome[-2:])
-            return datetime(ano, meses.get(mes, 1), 1)
-
-        dados_mensais = []
-
-        for arq in arquivos:
-            try:
-                df_mes = pd.read_csv(arq, sep=";", encoding="latin1", quotechar='"')
-                df_mes.columns = [col.strip().lower() for col in df_mes.columns]
-                col_pago = expected.get("pago ate o mes")
-
-                if col_pago and col_pago.lower() in df_mes.columns:
-                    total_pago = df_mes[col_pago.lower()].astype(str).str.replace(",", ".").astype(float).sum()
-                    dados_mensais.append({
-                        "mes": extrair_mes_ano(arq),
-                        "valor_pago": total_pago
-                    })
-
-            except Exception as e:
+        # leitura única dos arquivos mensais em uma tabela longa
+        # (mês x função x subfunção x categoria x valores); as séries
+        # global e por função saem dela por agregação
+        if pacote is not None:
+            df_historico = pacote.historico
+        else:
+            with medir("histórico") as _m:
+                df_historico, erros_historico = ler_historico(pasta_historico)
+                _m["linhas"] = len(df_historico)
+            for arq, e in erros_historico:
                 st.error(f"Erro ao ler {arq}: {e}")
 
+            # previsões de todas as funções em segundo plano (uma vez por
+            # versão do histórico); a seleção abaixo só consulta o cache
+            agendar_catalogo(df_historico, destino=particao.catalogo)
+
+        # Dados para Prophet
+        df_prophet = serie_previsao(df_historico)
+        df_hist = df_prophet.rename(columns={"ds": "mes", "y": "valor_pago"})
+
         # -------------------
         # Geração da previsão
         # -------------------
-        if len(dados_mensais) >= 3:
-            df_hist = pd.DataFrame(dados_mensais)
-            df_hist["mes"] = pd.to_datetime(df_hist["mes"], errors="coerce")
-            df_hist = (
-                df_hist.groupby(df_hist["mes"].dt.to_period("M"), as_index=False)
-                .last()
-                .rename(columns={"mes": "periodo"})
-            )
-
-            # Agora converte de Period → Timestamp corretamente
-            df_hist["mes"] = df_hist["periodo"].astype("period[M]").dt.to_timestamp()
-            df_hist.drop(columns=["periodo"], inplace=True)
-
-            # Dados para Prophet
-            df_prophet = df_hist.rename(columns={"mes": "ds", "valor_pago": "y"})
-
-            modelo = Prophet()
-            modelo.fit(df_prophet)
-
-            futuro = modelo.make_future_dataframe(periods=2, freq="M")
-            previsao = modelo.predict(futuro)
-
-            # 🔹 Mantém apenas o último registro de cada mês
-            previsao["mes"] = previsao["ds"].dt.to_period("M").dt.to_timestamp()
-            previsao = previsao.groupby("mes", as_index=False).last()
+        if len(df_hist) >= 3:
+            # vem do pacote ou do cache de previsões (previsao.py): o ajuste
+            # só roda de novo quando a série histórica ou os parâmetros mudam
+            with medir("previsão: total", len(df_prophet)):
+                previsao = prever_tela(df_prophet, "total", "Total")
 
             # -------------------
             # Gráfico
-            fig = px.line(
-            previsao,
-            x="mes",
-            y="yhat",
-            title="📈 Projeção de Gastos Futuros",
-            labels={"mes": "Período", "yhat": "Valor (R$)"},
-            )
+            def linhas_previsao(previsao, df_hist):
+                fig = px.line(
+                previsao,
+                x="mes",
+                y="yhat",
+                title="📈 Projeção de Gastos Futuros",
+                labels={"mes": "Período", "yhat": "Valor (R$)"},
+                )
 
-            # Linha de previsão
-            fig.update_traces(
-                line=dict(color="orange", width=3),
-                mode="markers+lines",
-                marker=dict(size=6),
-                name="Previsão",
-            )
+                # Linha de previsão
+                fig.update_traces(
+                    line=dict(color="orange", width=3),
+                    mode="markers+lines",
+                    marker=dict(size=6),
+                    name="Previsão",
+                )
 
-            # 🔹 Adiciona a linha do histórico (azul)
-            fig.add_scatter(
-                x=df_hist["mes"],
-                y=df_hist["valor_pago"],
-                mode="markers+lines",
-                name="Histórico Real",
-                line=dict(color="royalblue", width=3),
-                marker=dict(size=6),
-            )
+                # 🔹 Adiciona a linha do histórico (azul)
+                fig.add_scatter(
+                    x=df_hist["mes"],
+                    y=df_hist["valor_pago"],
+                    mode="markers+lines",
+                    name="Histórico Real",
+                    line=dict(color="royalblue", width=3),
+                    marker=dict(size=6),
+                )
 
-            fig.update_layout(
-                legend_title="Legenda",
-                template="plotly_white",
-                hovermode="x unified",
+                fig.update_layout(
+                    legend_title="Legenda",
+                    template="plotly_white",
+                    hovermode="x unified",
+                )
+                return fig
+
+            # só as colunas desenhadas, arredondadas, entram no gráfico
+            grafico(
+                "Projeção de Gastos Futuros",
+                [arredondar(previsao[["mes", "yhat"]]), arredondar(df_hist[["mes", "valor_pago"]])],
+                {},
+                linhas_previsao,
             )
 
-            st.plotly_chart(fig, use_container_width=True)
-
             # Previsão do próximo mês formatada
             proximo_mes = previsao.tail(1)[["mes", "yhat"]].iloc[0]
             valor_formatado = f"{proximo_mes['yhat']:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
@@ -566,104 +648,59 @@ with aba_previsoes:
             # ------------------------------------------------------------
             st.markdown("### 🔍 Previsão por Função")
 
-            col_funcao = expected.get("funcao descricao")
-
-            if col_funcao is None:
+            if df_historico["funcao"].isna().all():
                 st.error("A coluna 'funcao descricao' não foi encontrada nos arquivos.")
             else:
-                # ====== 1) LER OS MESMOS ARQUIVOS E AGRUPAR POR FUNÇÃO ======
-                funcoes_mensais = []
-
-                for arq in arquivos:
-                    try:
-                        df_mes = pd.read_csv(arq, sep=";", encoding="latin1", quotechar='"')
-                        df_mes.columns = [c.strip().lower() for c in df_mes.columns]
-
-                        if col_funcao.lower() in df_mes.columns and col_pago.lower() in df_mes.columns:
-                            df_mes[col_pago.lower()] = (
-                                df_mes[col_pago.lower()]
-                                .astype(str)
-                                .str.replace(",", ".")
-                            ).astype(float)
-
-                            df_mes["mes"] = extrair_mes_ano(arq)
-
-                            # somar POR FUNÇÃO
-                            df_group = (
-                                df_mes.groupby([ "mes", col_funcao.lower() ])[col_pago.lower()]
-                                .sum()
-                                .reset_index()
-                                .rename(columns={col_funcao.lower(): "funcao", col_pago.lower(): "valor_pago"})
-                            )
-
-                            funcoes_mensais.append(df_group)
-
-                    except Exception as erro:
-                        st.error(f"Erro ao processar {arq}: {erro}")
-
-                if funcoes_mensais:
-                    df_funcoes_full = pd.concat(funcoes_mensais, ignore_index=True)
-
-                    lista_funcoes = sorted(df_funcoes_full["funcao"].unique())
+                lista_funcoes = sorted(df_historico["funcao"].dropna().unique())
 
+                if lista_funcoes:
                     escolha = st.selectbox("Selecione uma função:", lista_funcoes)
 
-                    df_func = df_funcoes_full[df_funcoes_full["funcao"] == escolha].copy()
-
-                    # ====== 2) Preparar histórico ====== 
-                    # Primeiro, converte mes para Period antes de agrupar
-                    df_func["mes_period"] = df_func["mes"].dt.to_period("M")
-
-                    # Agrupa e soma apenas valor_pago
-                    df_func_grouped = (
-                        df_func.groupby("mes_period", as_index=False)["valor_pago"]
-                        .sum()
-                    )
-
-                    # Converte Period de volta para Timestamp
-                    df_func_grouped["mes"] = df_func_grouped["mes_period"].dt.to_timestamp()
-                    df_func_grouped = df_func_grouped.drop(columns=["mes_period"])
+                    # ====== 2) Preparar histórico ======
+                    df_prophet_f = serie_previsao(df_historico, filtro={"funcao": escolha})
+                    df_func_grouped = df_prophet_f.rename(columns={"ds": "mes", "y": "valor_pago"})
 
                     if len(df_func_grouped) >= 3:
-                        # ====== 3) Rodar prophet específico ====== 
-                        df_prophet_f = df_func_grouped.rename(columns={"mes": "ds", "valor_pago": "y"})
-                        modelo_f = Prophet()
-                        modelo_f.fit(df_prophet_f)
-                        
-                        futuro_f = modelo_f.make_future_dataframe(periods=2, freq="M")
-                        prev_f = modelo_f.predict(futuro_f)
-                        prev_f["mes"] = prev_f["ds"].dt.to_period("M").dt.to_timestamp()
-                        prev_f = prev_f.groupby("mes", as_index=False).last()
-                        
+                        # ====== 3) Rodar prophet específico ======
+                        with medir("previsão: função", len(df_prophet_f)):
+                            prev_f = prever_tela(df_prophet_f, "funcao", escolha)
+
                         # ====== 4) GRÁFICO PLOTLY ====== 
-                        fig_f = px.line(
-                            prev_f,
-                            x="mes", 
-                            y="yhat",
-                            title=f"📈 Previsão para a Função: {escolha}",
-                            labels={"mes": "Mês", "yhat": "Valor (R$)"}
-                        )
-                        
-                        # linha previsão
-                        fig_f.update_traces(
-                            line=dict(color="orange", width=3),
-                            mode="markers+lines",
-                            marker=dict(size=6),
-                            name="Previsão"
-                        )
-                        
-                        # linha histórico
-                        fig_f.add_scatter(
-                            x=df_func_grouped["mes"],
-                            y=df_func_grouped["valor_pago"],
-                            mode="markers+lines",
-                            name="Histórico Real",
-                            line=dict(color="royalblue", width=3),
-                            marker=dict(size=6),
+                        def linhas_funcao(prev_f, df_func_grouped):
+                            fig_f = px.line(
+                                prev_f,
+                                x="mes", 
+                                y="yhat",
+                                title=f"📈 Previsão para a Função: {escolha}",
+                                labels={"mes": "Mês", "yhat": "Valor (R$)"}
+                            )
+                            
+                            # linha previsão
+                            fig_f.update_traces(
+                                line=dict(color="orange", width=3),
+                                mode="markers+lines",
+                                marker=dict(size=6),
+                                name="Previsão"
+                            )
+                            
+                            # linha histórico
+                            fig_f.add_scatter(
+                                x=df_func_grouped["mes"],
+                                y=df_func_grouped["valor_pago"],
+                                mode="markers+lines",
+                                name="Histórico Real",
+                                line=dict(color="royalblue", width=3),
+                                marker=dict(size=6),
+                            )
+                            return fig_f
+
+                        grafico(
+                            "Previsão por Função",
+                            [arredondar(prev_f[["mes", "yhat"]]), arredondar(df_func_grouped[["mes", "valor_pago"]])],
+                            {"funcao": escolha},
+                            linhas_funcao,
                         )
                         
-                        st.plotly_chart(fig_f, use_container_width=True)
-                        
                         # ====== 5) Exibir previsão final ====== 
                         ultimo = prev_f.tail(1)[["mes", "yhat"]].iloc[0]
                         val = f"{ultimo['yhat']:,.2f}".replace(".", ",")
@@ -675,6 +712,99 @@ with aba_previsoes:
         else:
             st.info("São necessários pelo menos 3 meses de histórico para gerar previsões.")
 
+        # ------------------------------------------------------------
+        # 🔁 VARIAÇÕES MENSAIS (MoM) E ANUAIS (YoY)
+        # ------------------------------------------------------------
+        # fluxo de cada mês derivado dos acumulados "até o mês" (variacoes.py);
+        # a cada mês novo só os meses afetados são recalculados
+        st.markdown("### 🔁 Variações Mensais e Anuais")
+        col_nivel, col_metrica = st.columns(2)
+        with col_nivel:
+            nivel_var = st.selectbox(
+                "Nível", ["total"] + list(NOMES_NIVEIS),
+                format_func=lambda n: NOMES_NIVEIS.get(n, "Total"), key="nivel_variacoes",
+            )
+        with col_metrica:
+            metrica_var = st.radio(
+                "Métrica", list(METRICAS), index=list(METRICAS).index("pago"),
+                format_func=str.capitalize, horizontal=True, key="metrica_variacoes",
+            )
+
+        nivel_lista = [] if nivel_var == "total" else [nivel_var]
+        with medir("variações") as _m:
+            df_var = variacoes(df_historico, nivel_lista, metrica_var, origem=pasta_historico)
+            _m["linhas"] = len(df_var)
+        colunas_var = {
+            "mes": "Mês",
+            "fluxo": "Fluxo no mês (R$)",
+            "variacao_mom": "Variação MoM (R$)",
+            "variacao_mom_%": "MoM %",
+            "variacao_yoy": "Variação YoY (R$)",
+            "variacao_yoy_%": "YoY %",
+            "acumulado": "Acumulado (R$)",
+            "acumulado_yoy_%": "Acumulado YoY %",
+        }
+
+        if df_var.empty:
+            st.info("Sem meses suficientes para calcular variações.")
+        elif not nivel_lista:
+            ultimo_var = df_var.iloc[-1]
+            c1, c2, c3 = st.columns(3)
+            c1.metric(
+                f"Fluxo em {ultimo_var['mes'].strftime('%b/%Y')}", fmt_real(ultimo_var["fluxo"]),
+                None if pd.isna(ultimo_var["variacao_mom_%"]) else f"{ultimo_var['variacao_mom_%']:.1f}% MoM",
+            )
+            c2.metric("Acumulado", fmt_real(ultimo_var["acumulado"]),
+                      None if pd.isna(ultimo_var["acumulado_yoy_%"]) else f"{ultimo_var['acumulado_yoy_%']:.1f}% YoY")
+            c3.metric("Variação YoY do fluxo",
+                      "—" if pd.isna(ultimo_var["variacao_yoy_%"]) else f"{ultimo_var['variacao_yoy_%']:.1f}%")
+
+            def barras_fluxo(fluxo_df):
+                fig_fluxo = px.bar(
+                    fluxo_df, x="mes", y="fluxo",
+                    title=f"Fluxo mensal: {metrica_var.capitalize()}",
+                    labels={"mes": "Mês", "fluxo": "Valor (R$)"},
+                )
+                return fig_fluxo
+
+            grafico("Fluxo mensal", arredondar(df_var[["mes", "fluxo"]]), {"metrica": metrica_var}, barras_fluxo)
+            st.dataframe(arredondar(df_var[list(colunas_var)]).rename(columns=colunas_var), use_container_width=True, hide_index=True)
+        else:
+            # último mês, das maiores para as menores variações (em valor absoluto)
+            ultimo_mes = df_var["mes"].max()
+            ranking = df_var[df_var["mes"] == ultimo_mes]
+            ranking = ranking.reindex(ranking["variacao_mom"].abs().sort_values(ascending=False, na_position="last").index)
+            st.caption(f"{NOMES_NIVEIS[nivel_var]}: variações de {ultimo_mes.strftime('%b/%Y')}")
+            st.dataframe(
+                arredondar(ranking[[nivel_var] + list(colunas_var)[1:]]).rename(columns={nivel_var: NOMES_NIVEIS[nivel_var], **colunas_var}),
+                use_container_width=True, hide_index=True,
+            )
+
+        # ------------------------------------------------------------
+        # 🚨 MESES ATÍPICOS (AÇÃO x FONTE)
+        # ------------------------------------------------------------
+        # z-score robusto sobre todas as séries de uma vez (anomalias.py)
+        st.markdown("### 🚨 Meses Atípicos por Ação e Fonte")
+        limiar = st.slider("Sensibilidade (|z| mínimo)", 2.0, 10.0, LIMIAR_Z, 0.5, key="limiar_anomalias")
+        with medir("anomalias", len(df_historico)):
+            df_anomalias = detectar_anomalias(df_historico, NIVEL_PADRAO, metrica_var, limiar=limiar, origem=pasta_historico)
+
+        if df_anomalias.empty:
+            st.success("Nenhum mês atípico encontrado com essa sensibilidade.")
+        else:
+            st.caption(
+                f"{len(df_anomalias)} meses atípicos em {df_anomalias[list(NIVEL_PADRAO)].drop_duplicates().shape[0]} "
+                f"combinações de ação e fonte ({metrica_var}, fluxo do mês contra a mediana da série)"
+            )
+            st.dataframe(
+                arredondar(df_anomalias.head(200)).rename(columns={
+                    "acao_codigo": "Ação (código)", "fonte_codigo": "Fonte (código)",
+                    "acao": "Ação", "fonte": "Fonte", "mes": "Mês", "fluxo": "Fluxo no mês (R$)",
+                    "referencia": "Referência (R$)", "desvio": "Desvio (R$)", "z": "z robusto",
+                }),
+                use_container_width=True, hide_index=True,
+            )
+
     st.warning("⚠️ Lembre-se: previsões são estimativas baseadas em dados históricos e podem não refletir com precisão os resultados futuros reais.")
     st.info("""
     ---
@@ -731,3 +861,64 @@ with aba_previsoes:
     - É excelente para prever valores mensais de pagamentos e gastos.
     """)
 
+# -------------------------
+# INICIALIZAÇÃO
+# -------------------------
+# primeira execução do processo: registra o tempo de cada etapa e aquece
+# em segundo plano o que ainda não foi importado
+inicializacao.concluir(_inicio_script)
+if PREVISOR == "prophet":
+    aquecer_em_segundo_plano(["prophet"])
+
+# vigia de arquivos (vigia.py): novos arquivos são lidos em segundo plano
+vigia = iniciar_vigia(registro)
+
+with st.sidebar.expander("⏱️ Inicialização"):
+    if pacote is not None:
+        st.caption(f"pacote pré-calculado: {pacote.versao}")
+    else:
+        st.caption("sem pacote pré-calculado: agregados e previsões calculados no app")
+    renovacao = vigia.ultima_renovacao(particao.chave)
+    if not vigia.ativo:
+        st.caption("vigia de arquivos desligado")
+    elif renovacao is not None:
+        st.caption(f"vigia de arquivos: dados renovados às {time.strftime('%H:%M:%S', time.localtime(renovacao['quando']))} ({renovacao['segundos']:.1f}s)")
+    else:
+        st.caption(f"vigia de arquivos: conferindo a cada {vigia.intervalo:.0f}s")
+    if compartilhado.ativo():
+        st.caption(f"dados compartilhados entre processos: {len(compartilhado.publicados())} conjuntos em {compartilhado.PASTA_COMPARTILHADA}")
+    for etapa, segundos in inicializacao.relatorio().items():
+        st.caption(f"{etapa}: {segundos:.2f}s")
+
+with st.sidebar.expander("📦 Tamanho dos gráficos"):
+    for nome, tamanho in tamanhos_graficos.items():
+        st.caption(f"{nome}: {tamanho / 1024:.1f} KB")
+
+# -------------------------
+# DESEMPENHO (?admin=1)
+# -------------------------
+# tempo total desta execução do script; o arquivo de métricas é regravado
+# no máximo a cada GRAVACAO_METRICAS_S
+metricas.registrar("execução completa", time.perf_counter() - _inicio_script)
+metricas.exportar()
+
+if modo_admin:
+    colunas_metricas = {
+        "etapa": "Etapa", "amostras": "Amostras", "media_ms": "Média (ms)", "p50_ms": "p50 (ms)", "p90_ms": "p90 (ms)",
+        "p95_ms": "p95 (ms)", "p99_ms": "p99 (ms)", "max_ms": "Máx. (ms)", "linhas": "Linhas", "memoria_mb": "Memória (MB)",
+    }
+    with aba_desempenho:
+        st.subheader("🛠️ Desempenho por etapa")
+        st.caption(f"todas as sessões do processo ({metricas.sessoes()} sessões, últimas amostras de cada etapa)")
+        st.dataframe(
+            arredondar(pd.DataFrame(metricas.resumo(), columns=list(colunas_metricas))).rename(columns=colunas_metricas),
+            use_container_width=True, hide_index=True,
+        )
+        st.caption("esta sessão")
+        st.dataframe(
+            arredondar(pd.DataFrame(metricas.resumo(st.session_state["sessao_metricas"]), columns=list(colunas_metricas))).rename(columns=colunas_metricas),
+            use_container_width=True, hide_index=True,
+        )
+        st.download_button("📥 Baixar métricas (Prometheus)", metricas.texto(), file_name="metricas.prom", mime="text/plain")
+        if ARQUIVO_METRICAS:
+            st.caption(f"as mesmas métricas são gravadas em {ARQUIVO_METRICAS}")
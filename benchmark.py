@@ -0,0 +1,450 @@
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+
+from carregamento import (
+    NUMERIC_COLS, caminho_colunar, compactar, converter_numericos, find_col, ler_colunar, mapear_colunas, salvar_colunar,
+)
+from consultas import obter_consultas
+from cubo import IndiceFiltros
+from streaming import LINHAS_BLOCO, AgregadosArquivo
+
+# -------------------------
+# CONFIG
+# -------------------------
+PASTA_RESULTADOS = os.path.join("dados", ".cache", "benchmarks")
+# linhas por bloco ao gravar exportações sintéticas grandes
+BLOCO_GERACAO = 500_000
+MESES_ABREV = ["JAN", "FEV", "MAR", "ABR", "MAI", "JUN", "JUL", "AGO", "SET", "OUT", "NOV", "DEZ"]
+
+# mesmo cabeçalho (e ordem) das exportações em dados/
+COLUNAS = [
+    "Fonte", "Descrição da Fonte",
+    "Orçado - Inicial", "Orçado - Atualizado",
+    "Empenhado - No Mês", "Empenhado - Até o Mês",
+    "Liquidado - No Mês", "Liquidado - Até o Mês",
+    "Pago - No Mês", "Pago - Até o Mês",
+    "Função - Código", "Função - Descrição",
+    "Subfunção - Código", "Subfunção - Descricao",
+    "Programa - Código", "Programa - Descrição",
+    "Ação - Código", "Ação - Descrição",
+    "Categoria Econômica", "Descrição Categoria Econômica",
+    "Grupo de Despesa", "Descrição Grupo de Despesa",
+    "Modalidade", "Descrição Modalidade",
+]
+
+FUNCOES = ["Administração", "Educação", "Saúde", "Assistência Social", "Urbanismo", "Saneamento",
+           "Gestão Ambiental", "Cultura", "Desporto e Lazer", "Segurança Pública", "Transporte",
+           "Agricultura", "Habitação", "Previdência Social", "Legislativa", "Encargos Especiais"]
+CATEGORIAS = {3: "Despesas correntes", 4: "Despesas de capital"}
+GRUPOS = {1: "Pessoal e encargos sociais", 2: "Juros e encargos da dívida", 3: "Outras despesas correntes",
+          4: "Investimentos", 5: "Inversões financeiras", 6: "Amortização da dívida"}
+MODALIDADES = {90: "Aplicações diretas", 50: "Transferências a instituições privadas sem fins lucrativos",
+               91: "Aplicação direta decorrente de operação entre órgãos"}
+
+# -------------------------
+# EXPORTAÇÕES SINTÉTICAS
+# -------------------------
+# valores com duas casas como texto (vetorizado, via centavos inteiros)
+def _texto_monetario(valores, formato):
+    centavos = pc.cast(pc.round(pc.multiply(valores, 100)), pa.int64())
+    sinal = pc.if_else(pc.less(centavos, 0), "-", "")
+    centavos = pc.abs(centavos)
+    reais = pc.cast(pc.divide(centavos, 100), pa.string())
+    resto = pc.utf8_lpad(pc.cast(pc.subtract(centavos, pc.multiply(pc.divide(centavos, 100), 100)), pa.string()), 2, "0")
+    inteiro = pc.binary_join_element_wise(sinal, reais, "")
+    return pc.binary_join_element_wise(inteiro, resto, "," if formato == "virgula" else ".")
+
+# Hierarquia fixa (semente) de função -> subfunção -> programa -> ação e
+# um conjunto de fontes; cada linha sorteia uma ação, uma fonte e uma
+# classificação econômica, como nas exportações reais.
+class GeradorExportacao:
+    def __init__(self, semente=0, acoes=400, fontes=250):
+        rng = np.random.default_rng(semente)
+        self.semente = semente
+        n_sub = 6
+        self.acoes = pd.DataFrame({
+            "funcao": rng.integers(0, len(FUNCOES), acoes),
+            "sub": rng.integers(0, n_sub, acoes),
+            "programa": rng.integers(1, 40, acoes),
+            "acao": 1000 + np.arange(acoes),
+        })
+        self.fontes = 150070000000 + rng.choice(10**6, fontes, replace=False)
+        self.base = rng.lognormal(11, 1.5, acoes * 4)
+
+        # textos pré-montados por ação / fonte: cada linha só indexa
+        funcao = self.acoes["funcao"].to_numpy()
+        self.cod_funcao = funcao + 1
+        self.cod_sub = self.cod_funcao * 10 + self.acoes["sub"].to_numpy()
+        nomes = np.array(FUNCOES, dtype=object)[funcao]
+        self.textos = {
+            # descrições com espaços sobrando, como nas exportações reais
+            "Função - Descrição": np.array([f"{n:<35}" for n in nomes], dtype=object),
+            "Subfunção - Descricao": np.array([f"Subfunção {c} de {n}" for c, n in zip(self.cod_sub, nomes)], dtype=object),
+            "Programa - Descrição": np.array([f"Programa de gestão nº {p}" for p in self.acoes["programa"]], dtype=object),
+            "Ação - Descrição": np.array([f"Manutenção das atividades da ação {c}" for c in self.acoes["acao"]], dtype=object),
+        }
+        self.nomes_fontes = np.array([f" Recursos da fonte {f % 1000:03d}" for f in self.fontes], dtype=object)
+
+    def _bloco(self, rng, n, mes):
+        a = rng.integers(0, len(self.acoes), n)
+        f = rng.integers(0, len(self.fontes), n)
+        categoria = rng.choice(list(CATEGORIAS), n, p=[0.8, 0.2])
+        grupo = np.where(categoria == 3, rng.choice([1, 2, 3], n, p=[0.4, 0.05, 0.55]), rng.choice([4, 5, 6], n))
+        modalidade = rng.choice(list(MODALIDADES), n, p=[0.8, 0.1, 0.1])
+
+        orcado = np.round(self.base[rng.integers(0, len(self.base), n)], 2)
+        atualizado = np.round(orcado * rng.uniform(0.8, 1.4, n), 2)
+        fracao = min(mes / 12, 1.0)
+        emp_ate = np.round(atualizado * np.clip(rng.normal(fracao, 0.1, n), 0, 1), 2)
+        liq_ate = np.round(emp_ate * rng.uniform(0.7, 1.0, n), 2)
+        pago_ate = np.round(liq_ate * rng.uniform(0.9, 1.0, n), 2)
+        no_mes = rng.uniform(0, 1 / max(mes, 1), n)
+
+        return pd.DataFrame({
+            "Fonte": self.fontes[f],
+            "Descrição da Fonte": self.nomes_fontes[f],
+            "Orçado - Inicial": orcado,
+            "Orçado - Atualizado": atualizado,
+            "Empenhado - No Mês": np.round(emp_ate * no_mes, 2),
+            "Empenhado - Até o Mês": emp_ate,
+            "Liquidado - No Mês": np.round(liq_ate * no_mes, 2),
+            "Liquidado - Até o Mês": liq_ate,
+            "Pago - No Mês": np.round(pago_ate * no_mes, 2),
+            "Pago - Até o Mês": pago_ate,
+            "Função - Código": self.cod_funcao[a],
+            "Função - Descrição": self.textos["Função - Descrição"][a],
+            "Subfunção - Código": self.cod_sub[a],
+            "Subfunção - Descricao": self.textos["Subfunção - Descricao"][a],
+            "Programa - Código": self.acoes["programa"].to_numpy()[a],
+            "Programa - Descrição": self.textos["Programa - Descrição"][a],
+            "Ação - Código": self.acoes["acao"].to_numpy()[a],
+            "Ação - Descrição": self.textos["Ação - Descrição"][a],
+            "Categoria Econômica": categoria,
+            "Descrição Categoria Econômica": pd.Series(categoria).map(CATEGORIAS).to_numpy(),
+            "Grupo de Despesa": grupo,
+            "Descrição Grupo de Despesa": pd.Series(grupo).map(GRUPOS).to_numpy(),
+            "Modalidade": modalidade,
+            "Descrição Modalidade": pd.Series(modalidade).map(MODALIDADES).to_numpy(),
+        })[COLUNAS]
+
+    # grava `linhas` linhas no formato das exportações (latin1, ";", tudo
+    # entre aspas, CRLF); formato "virgula" grava os valores como 1234,56
+    def gravar(self, caminho, linhas, mes=12, formato="ponto"):
+        rng = np.random.default_rng([self.semente, mes, linhas])
+        os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+        with open(caminho, "wb") as f:
+            for inicio in range(0, linhas, BLOCO_GERACAO):
+                bloco = pa.Table.from_pandas(self._bloco(rng, min(BLOCO_GERACAO, linhas - inicio), mes), preserve_index=False)
+                for c in COLUNAS[2:10]:
+                    i = bloco.schema.get_field_index(c)
+                    bloco = bloco.set_column(i, c, _texto_monetario(bloco[c], formato))
+                saida = io.BytesIO()
+                pacsv.write_csv(bloco, saida, pacsv.WriteOptions(
+                    include_header=inicio == 0, delimiter=";", quoting_style="all_valid",
+                ))
+                # o writer do Arrow só grava UTF-8 com LF
+                f.write(saida.getvalue().decode("utf-8").encode("latin1").replace(b"\n", b"\r\n"))
+        return caminho
+
+    # um arquivo por mês (JAN25.txt, FEV25.txt...) com valores acumulados
+    def gravar_historico(self, pasta, meses, linhas, ano=2025):
+        arquivos = []
+        for i in range(meses):
+            mes = i % 12 + 1
+            nome = f"{MESES_ABREV[i % 12]}{(ano + i // 12) % 100:02d}.txt"
+            arquivos.append(self.gravar(os.path.join(pasta, nome), linhas, mes=mes))
+        return arquivos
+
+# -------------------------
+# MEDIÇÃO
+# -------------------------
+def cronometrar(funcao, repeticoes):
+    tempos = []
+    resultado = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return resultado, tempos
+
+# colunas medidas de cada linha de resultado; as demais (etapa e
+# contexto) identificam a linha ao comparar execuções
+MEDIDAS = ("repeticoes", "min_s", "mediana_s", "max_s", "linhas_s")
+
+class Resultados:
+    def __init__(self, repeticoes):
+        self.repeticoes = repeticoes
+        self.linhas = []
+
+    def medir(self, etapa, funcao, repeticoes=None, **contexto):
+        resultado, tempos = cronometrar(funcao, repeticoes or self.repeticoes)
+        self.linhas.append({
+            "etapa": etapa,
+            **contexto,
+            "repeticoes": len(tempos),
+            "min_s": min(tempos),
+            "mediana_s": statistics.median(tempos),
+            "max_s": max(tempos),
+        })
+        print(f"  {etapa:<28} {min(tempos) * 1000:10.2f} ms  {json.dumps(contexto, ensure_ascii=False)}")
+        return resultado
+
+def _ambiente():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+        "backend": os.environ.get("DASHBOARD_BACKEND", "pandas"),
+    }
+
+# -------------------------
+# CAMINHOS MEDIDOS
+# -------------------------
+def _ler_csv(caminho):
+    df = pd.read_csv(caminho, sep=";", encoding="latin1", quotechar='"')
+    df.columns = [c.strip() for c in df.columns]
+    return df
+
+# -------------------------
+# REFERÊNCIAS (CÓDIGO ORIGINAL DO APP)
+# -------------------------
+# Etapas "_original" reproduzem o caminho do app antes das otimizações e
+# são medidas ao lado da etapa atual equivalente (REFERENCIAS)
+REFERENCIAS = {
+    "conversao_numerica_original": "conversao_numerica",
+    "cascata_filtros_original": "cascata_filtros_fria",
+    "totais_original": "consultas_totais",
+}
+
+# formato decidido coluna a coluna pelas 20 primeiras células; texto ->
+# número uma coluna de cada vez
+def _conversao_original(df, expected):
+    for ncol in NUMERIC_COLS:
+        orig = expected.get(ncol)
+        if orig is None or orig not in df.columns:
+            continue
+        series = df[orig].astype(str).str.strip()
+        sample = series.dropna().astype(str).head(20).tolist()
+        uses_comma_decimal = any(
+            ((',' in s) and (s.count(',') >= 1) and (s[-3] == ',' or s[-2] == ','))
+            for s in sample if s and s not in ['nan', 'None']
+        )
+        if uses_comma_decimal:
+            series = series.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+        df[orig] = pd.to_numeric(series, errors="coerce").fillna(0.0)
+    return df
+
+# df.copy() + uma máscara por filtro para as opções de cada nível e, de
+# novo, df.copy() + máscaras para as linhas filtradas
+def _filtros_original(df, dims, selecao):
+    df_filtros = df.copy()
+    opcoes = []
+    for col in dims:
+        opcoes.append(sorted(df_filtros[col].dropna().unique()))
+        if col in selecao:
+            df_filtros = df_filtros[df_filtros[col] == selecao[col]]
+    df_filtrado = df.copy()
+    for col, valor in selecao.items():
+        df_filtrado = df_filtrado[df_filtrado[col] == valor]
+    return opcoes, df_filtrado
+
+# razão etapa original / etapa atual (mesmo contexto) de um resultado;
+# > 1 = a versão atual é mais rápida
+def comparar_referencias(relatorio):
+    def contexto(linha):
+        return json.dumps({k: v for k, v in linha.items()
+                           if k not in ("etapa", "backend") + MEDIDAS}, sort_keys=True)
+
+    atuais = {(l["etapa"], contexto(l)): l["min_s"] for l in relatorio["resultados"] if l.get("backend") in (None, "pandas")}
+    linhas = []
+    for l in relatorio["resultados"]:
+        atual = atuais.get((REFERENCIAS.get(l["etapa"]), contexto(l)))
+        if atual is not None:
+            linhas.append({"etapa": REFERENCIAS[l["etapa"]], **json.loads(contexto(l)), "original_s": l["min_s"],
+                           "atual_s": atual, "razao": l["min_s"] / atual if atual else float("nan")})
+    return pd.DataFrame(linhas)
+
+# seleção sorteada uma vez, antes das medições, a partir das combinações
+# do índice (sem passar pelo memo das opções)
+def _sortear_selecao(indice, rng):
+    selecao = {}
+    combinacoes = indice.combinacoes
+    for col in indice.colunas:
+        opcoes = sorted(combinacoes[col].dropna().unique())
+        if not opcoes:
+            break
+        selecao[col] = opcoes[rng.integers(len(opcoes))]
+        combinacoes = combinacoes[combinacoes[col] == selecao[col]]
+    return selecao
+
+def medir_relatorio(res, gerador, pasta, linhas, formato, backends):
+    caminho = gerador.gravar(os.path.join(pasta, f"Relatorio_{linhas}.txt"), linhas, formato=formato)
+    ctx = {"linhas": linhas, "formato": formato}
+
+    # modo arquivo grande: uma passada em blocos, só os agregados em memória
+    agregados = res.medir("streaming_cubo", lambda: AgregadosArquivo(caminho), bloco=LINHAS_BLOCO, **ctx)
+    res.linhas[-1]["linhas_s"] = agregados.vazao["linhas_s"]
+
+    bruto = res.medir("csv_parse", lambda: _ler_csv(caminho), **ctx)
+    expected = res.medir("mapear_colunas", lambda: mapear_colunas(bruto.columns), **ctx)
+    res.medir("find_col", lambda: [find_col(bruto.columns, n) for n in NUMERIC_COLS], **ctx)
+    df, _ = res.medir("conversao_numerica", lambda: converter_numericos(bruto.copy(), expected), **ctx)
+    original = res.medir("conversao_numerica_original", lambda: _conversao_original(bruto.copy(), expected), **ctx)
+    valores = {expected.get(n) for n in NUMERIC_COLS}
+    df = res.medir("compactar", lambda: compactar(df.copy(), valores=valores), **ctx)
+    res.medir("colunar_gravar", lambda: salvar_colunar(df, caminho), repeticoes=1, **ctx)
+    df = res.medir("colunar_ler", lambda: ler_colunar(caminho), **ctx)
+
+    dims = [expected.get(n) for n in ["funcao descricao", "subfuncao descricao", "descricao categoria economica"]]
+    indice = res.medir("indice_filtros", lambda: IndiceFiltros(df, dims), **ctx)
+    selecao = _sortear_selecao(indice, np.random.default_rng(linhas))
+
+    def cascata():
+        # função -> subfunção -> categoria, como o usuário nos filtros
+        anteriores = {}
+        for col in indice.colunas:
+            indice.opcoes(col, anteriores)
+            if col in selecao:
+                anteriores[col] = selecao[col]
+        return indice.linhas(selecao)
+
+    def cascata_fria():
+        indice.limpar_memo()
+        return cascata()
+
+    # fria: opções calculadas a cada vez, como no original; memo: seleção
+    # repetida, opções já guardadas no índice
+    res.medir("cascata_filtros_fria", cascata_fria, **ctx)
+    res.medir("cascata_filtros_memo", cascata, **ctx)
+    # o original filtra o DataFrame sem compactar (textos como object)
+    _, filtrado = res.medir("cascata_filtros_original", lambda: _filtros_original(original, dims, selecao), **ctx)
+    medidas = [expected.get(n) for n in NUMERIC_COLS if expected.get(n) in filtrado.columns]
+    res.medir("totais_original", lambda: {m: filtrado[m].sum() for m in medidas}, **ctx)
+    res.medir("filtro_mascara_booleana", lambda: df[np.logical_and.reduce([df[c] == v for c, v in selecao.items()])], **ctx)
+    res.medir("groupby_direto", lambda: df.groupby(dims[0], observed=True)[[expected.get(n) for n in NUMERIC_COLS]].sum(), **ctx)
+
+    for backend in backends:
+        contexto = dict(ctx, backend=backend)
+        consultas = res.medir("consultas_construir", lambda: obter_consultas(df, caminho, expected, backend), repeticoes=1, **contexto)
+        if consultas.nome != backend:
+            continue
+        medida = expected.get("pago ate o mes")
+        res.medir("consultas_totais", lambda: consultas.totais(selecao), **contexto)
+        res.medir("consultas_agregar", lambda: consultas.agregar(dims[1], None, {dims[0]: selecao.get(dims[0])}), **contexto)
+        res.medir("consultas_top_n", lambda: consultas.top_n(dims[0], medida, 3), **contexto)
+
+def medir_historico(res, gerador, pasta, meses, linhas, previsores):
+    from historico import WORKERS_HISTORICO, ArmazemHistorico, listar_arquivos, matriz_series, serie_previsao
+    from previsores import obter_previsor
+    from variacoes import variacoes
+    from anomalias import detectar_anomalias
+
+    pasta_hist = os.path.join(pasta, f"historico_{meses}x{linhas}")
+    gerador.gravar_historico(pasta_hist, meses, linhas)
+    ctx = {"meses": meses, "linhas_por_mes": linhas}
+
+    def sincronizar(workers):
+        # sem as cópias colunares da rodada anterior: toda rodada faz o parse
+        for arq in listar_arquivos(pasta_hist):
+            if os.path.exists(caminho_colunar(arq)):
+                os.remove(caminho_colunar(arq))
+        armazem = ArmazemHistorico(os.path.join(pasta_hist, ".cache", f"bench_{time.perf_counter_ns()}.sqlite"))
+        armazem.sincronizar(pasta_hist, workers)
+        return armazem
+
+    # sequencial e com o pool de leitura (se houver mais de um núcleo)
+    for workers in sorted({1, WORKERS_HISTORICO}):
+        armazem = res.medir("historico_sincronizar", lambda: sincronizar(workers), repeticoes=1, workers=workers, **ctx)
+    tabela = res.medir("historico_tabela", armazem.tabela, **ctx)
+    res.medir("variacoes_acao_fonte", lambda: variacoes(tabela, ["acao", "fonte"]), **ctx)
+    res.medir("anomalias_acao_fonte", lambda: detectar_anomalias(tabela), **ctx)
+
+    serie = serie_previsao(tabela)
+    datas, _, Y = matriz_series(tabela, ["funcao"])
+    for nome in previsores:
+        try:
+            previsor = obter_previsor(nome)
+            contexto = dict(ctx, previsor=nome)
+            res.medir("previsao_serie_total", lambda: previsor.prever(serie, 2), repeticoes=1, **contexto)
+            res.medir("previsao_lote_funcoes", lambda: previsor.prever_lote(datas, Y, 2), repeticoes=1, series=len(Y), **contexto)
+        except ImportError as e:
+            print(f"  previsor {nome} indisponível: {e}")
+
+# -------------------------
+# EXECUÇÃO
+# -------------------------
+def executar(linhas=(10**3, 10**4, 10**5), meses=(12,), linhas_historico=10**4, formato="ponto",
+             backends=("pandas",), previsores=("numpy",), repeticoes=3, saida=None, manter=False, semente=0):
+    pasta = tempfile.mkdtemp(prefix="bench_dashboard_")
+    gerador = GeradorExportacao(semente)
+    res = Resultados(repeticoes)
+    inicio = time.perf_counter()
+    try:
+        for n in linhas:
+            print(f"relatório com {n} linhas")
+            medir_relatorio(res, gerador, pasta, n, formato, backends)
+        for m in meses:
+            print(f"histórico com {m} meses x {linhas_historico} linhas")
+            medir_historico(res, gerador, pasta, m, linhas_historico, previsores)
+    finally:
+        if not manter:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+    agora = datetime.now()
+    relatorio = {
+        "gerado_em": agora.isoformat(timespec="seconds"),
+        "duracao_s": time.perf_counter() - inicio,
+        "ambiente": _ambiente(),
+        "parametros": {
+            "linhas": list(linhas), "meses": list(meses), "linhas_historico": linhas_historico,
+            "formato": formato, "backends": list(backends), "previsores": list(previsores),
+            "repeticoes": repeticoes, "semente": semente,
+        },
+        "resultados": res.linhas,
+    }
+    saida = saida or os.path.join(PASTA_RESULTADOS, f"benchmark_{agora.strftime('%Y%m%dT%H%M%S')}.json")
+    os.makedirs(os.path.dirname(saida) or ".", exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    return saida, relatorio
+
+# compara dois arquivos de resultado (mesma etapa + contexto): razão dos
+# tempos mínimos, > 1 = mais lento que a referência
+def comparar(referencia, atual):
+    def chaves(relatorio):
+        itens = {}
+        for linha in relatorio["resultados"]:
+            contexto = {k: v for k, v in linha.items() if k not in MEDIDAS}
+            itens[json.dumps(contexto, sort_keys=True, ensure_ascii=False)] = linha["min_s"]
+        return itens
+
+    with open(referencia, encoding="utf-8") as f:
+        ref = chaves(json.load(f))
+    with open(atual, encoding="utf-8") as f:
+        novo = chaves(json.load(f))
+    linhas = [
+        {**json.loads(k), "referencia_s": ref[k], "atual_s": novo[k], "razao": novo[k] / ref[k] if ref[k] else float("nan")}
+        for k in ref if k in novo
+    ]
+    return pd.DataFrame(linhas)
@@ -0,0 +1,328 @@
+import json
+import logging
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather
+
+import compartilhado
+from desempenho import medir
+
+# -------------------------
+# CONFIG
+# -------------------------
+# limite de memória do cache de DataFrames (compartilhado entre sessões)
+CACHE_LIMITE_MB = int(os.environ.get("DASHBOARD_CACHE_MB", "512"))
+
+# cópia colunar (Arrow/Feather) ao lado de cada exportação de texto
+COLUNAR_ATIVO = os.environ.get("DASHBOARD_COLUNAR", "1") != "0"
+PASTA_COLUNAR = ".cache"
+# formato dos valores nas exportações (ver detectar_formato)
+FORMATO_NUMERICO = os.environ.get("DASHBOARD_FORMATO_NUMERICO", "auto")
+
+# muda quando o esquema gerado pelo carregamento muda (invalida as cópias)
+VERSAO_ESQUEMA = 2
+
+logger = logging.getLogger(__name__)
+
+EXPECTED_COLS = [
+    "orcado inicial",
+    "orcado atualizado",
+    "empenhado no mes",
+    "empenhado ate o mes",
+    "liquidado no mes",
+    "liquidado ate o mes",
+    "pago no mes",
+    "pago ate o mes",
+    "funcao descricao",
+    "subfuncao descricao",
+    "descricao categoria economica",
+    "orgao",
+]
+
+NUMERIC_COLS = [
+    "orcado inicial", "orcado atualizado",
+    "empenhado no mes", "empenhado ate o mes",
+    "liquidado no mes", "liquidado ate o mes",
+    "pago no mes", "pago ate o mes"
+]
+
+# -------------------------
+# FUNÇÕES AUXILIARES
+# -------------------------
+def normalize(col: str) -> str:
+    if not isinstance(col, str):
+        return col
+    s = unicodedata.normalize("NFKD", col)
+    s = s.encode("ascii", "ignore").decode("ascii")
+    s = s.lower().strip()
+    s = s.replace(" - ", " ").replace("-", " ").replace("/", " ").replace(".", "")
+    s = " ".join(s.split())
+    return s
+
+def find_col(df_cols, target_norm):
+    for c in df_cols:
+        if normalize(c) == target_norm:
+            return c
+    return None
+
+def mapear_colunas(df_cols):
+    return {k: find_col(df_cols, k) for k in EXPECTED_COLS}
+
+# -------------------------
+# LEITURA E CONVERSÃO
+# -------------------------
+# Formato dos valores monetários: "auto" (detectado uma vez por arquivo),
+# "ponto" (1234.56 / 1,234.56) ou "virgula" (1234,56 / 1.234,56)
+def detectar_formato(textos):
+    virgula = textos.str.contains(r",\d{1,2}$", regex=True).sum()
+    ponto = (textos.str.contains(r"\.\d{1,2}$", regex=True) & ~textos.str.contains(",", regex=False)).sum()
+    return "virgula" if virgula > ponto else "ponto"
+
+# Converte as colunas de valores de uma vez. Colunas que o read_csv já leu
+# como número (formato com ponto) só têm os vazios zerados; as que vieram
+# como texto são empilhadas em uma única Series, convertidas no formato do
+# arquivo e remontadas. Devolve também quantas células foram rejeitadas
+# (texto não vazio que não é número) por coluna. Com centavos=True os
+# valores ficam em int64 de centavos (ponto fixo exato).
+def converter_numericos(df, expected, formato=None, centavos=False):
+    formato = formato or FORMATO_NUMERICO
+    colunas = [expected.get(n) for n in NUMERIC_COLS if expected.get(n) in df.columns]
+    textuais = [c for c in colunas if not pd.api.types.is_numeric_dtype(df[c].dtype)]
+    rejeitados = {}
+
+    if textuais:
+        bloco = df[textuais]
+        vazio = bloco.isna().to_numpy().ravel(order="F")
+        textos = pd.Series(bloco.astype(str).to_numpy().ravel(order="F")).str.strip()
+        if formato == "auto":
+            formato = detectar_formato(textos[~vazio])
+        if formato == "virgula":
+            textos = textos.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+        else:
+            textos = textos.str.replace(",", "", regex=False)
+
+        valores = pd.to_numeric(textos, errors="coerce").to_numpy()
+        rejeitado = np.isnan(valores) & ~vazio & ~textos.isin(["", "nan", "None"]).to_numpy()
+        forma = (len(df), len(textuais))
+        df[textuais] = valores.reshape(forma, order="F")
+        rejeitados = {
+            c: int(n) for c, n in zip(textuais, rejeitado.reshape(forma, order="F").sum(axis=0)) if n
+        }
+
+    for c in colunas:
+        serie = df[c].fillna(0.0)
+        df[c] = np.rint(serie * 100).astype("int64") if centavos else serie.astype("float64")
+    return df, rejeitados
+
+# Esquema compacto:
+# - descrições (texto repetitivo, às vezes com espaços sobrando) -> categorias
+#   com os valores sem espaços nas pontas
+# - códigos -> menor tipo inteiro que comporta os valores
+# - valores monetários ficam como convertidos (float64 ou centavos)
+def compactar(df, valores=()):
+    for c in df.columns:
+        serie = df[c]
+        if c in valores:
+            continue
+        if pd.api.types.is_object_dtype(serie.dtype) or pd.api.types.is_string_dtype(serie.dtype):
+            df[c] = serie.str.strip().astype("category")
+        elif pd.api.types.is_integer_dtype(serie.dtype):
+            df[c] = pd.to_numeric(serie, downcast="integer")
+    return df
+
+# por arquivo lido do texto: bytes antes/depois da compactação e células
+# de valores rejeitadas na conversão numérica
+memoria = {}
+rejeitados = {}
+
+def ler_texto(caminho):
+    with medir("leitura csv") as m:
+        df = pd.read_csv(caminho, sep=";", encoding="latin1", quotechar='"')
+        m["linhas"] = len(df)
+    df.columns = [c.strip() for c in df.columns]
+    expected = mapear_colunas(df.columns)
+    with medir("conversão numérica", len(df)):
+        df, rejeitados_arquivo = converter_numericos(df, expected)
+    rejeitados[os.path.abspath(caminho)] = rejeitados_arquivo
+    if rejeitados_arquivo:
+        logger.warning("%s: células numéricas rejeitadas %s", caminho, rejeitados_arquivo)
+
+    antes = int(df.memory_usage(deep=True).sum())
+    with medir("compactação", len(df)):
+        df = compactar(df, valores={expected.get(n) for n in NUMERIC_COLS})
+    depois = int(df.memory_usage(deep=True).sum())
+    memoria[os.path.abspath(caminho)] = {"antes": antes, "depois": depois}
+    logger.info("%s: %.1f MB -> %.1f MB em memória", caminho, antes / 2**20, depois / 2**20)
+    return df
+
+# -------------------------
+# CÓPIA COLUNAR (ARROW/FEATHER)
+# -------------------------
+# dados/Relatorio.txt -> dados/.cache/Relatorio.arrow
+def caminho_colunar(caminho):
+    pasta, nome = os.path.split(os.path.abspath(caminho))
+    return os.path.join(pasta, PASTA_COLUNAR, os.path.splitext(nome)[0] + ".arrow")
+
+def _origem(caminho):
+    info = os.stat(caminho)
+    return {"tamanho": info.st_size, "mtime_ns": info.st_mtime_ns, "esquema": VERSAO_ESQUEMA}
+
+def colunar_atualizado(caminho):
+    destino = caminho_colunar(caminho)
+    if not os.path.exists(destino):
+        return False
+    try:
+        with pa.memory_map(destino) as f:
+            meta = pa.ipc.open_file(f).schema.metadata or {}
+        return json.loads(meta.get(b"origem", b"{}")) == _origem(caminho)
+    except (OSError, ValueError, pa.ArrowInvalid):
+        return False
+
+def salvar_colunar(df, caminho):
+    destino = caminho_colunar(caminho)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    meta = dict(tabela.schema.metadata or {})
+    meta[b"origem"] = json.dumps(_origem(caminho)).encode()
+    tabela = tabela.replace_schema_metadata(meta)
+    # grava em arquivo temporário e troca de uma vez: leitores nunca veem
+    # um arquivo pela metade
+    temporario = f"{destino}.{os.getpid()}.tmp"
+    feather.write_feather(tabela, temporario, compression="uncompressed")
+    os.replace(temporario, destino)
+    return destino
+
+def ler_colunar(caminho):
+    return feather.read_table(caminho_colunar(caminho), memory_map=True).to_pandas()
+
+def gerar_colunar(caminho, forcar=False):
+    if not forcar and colunar_atualizado(caminho):
+        return caminho_colunar(caminho)
+    return salvar_colunar(ler_texto(caminho), caminho)
+
+def ler_arquivo(caminho):
+    if COLUNAR_ATIVO and colunar_atualizado(caminho):
+        try:
+            return ler_colunar(caminho)
+        except (OSError, pa.ArrowInvalid):
+            pass
+
+    df = ler_texto(caminho)
+    if COLUNAR_ATIVO:
+        try:
+            salvar_colunar(df, caminho)
+        except OSError:
+            # pasta somente leitura: segue apenas com o texto
+            pass
+    return df
+
+# Relatório pedido pelo cache: com DASHBOARD_COMPARTILHADO, é publicado uma
+# vez por versão do arquivo (compartilhado.py) e cada processo do servidor
+# só mapeia a versão publicada, sem ler nem copiar os dados
+def ler_relatorio(caminho):
+    if not compartilhado.ativo():
+        return ler_arquivo(caminho)
+    df, _ = compartilhado.obter(caminho, _origem(caminho), lambda: (ler_arquivo(caminho), {}))
+    return df
+
+# -------------------------
+# CACHE POR (CAMINHO, TAMANHO, MTIME)
+# -------------------------
+# Os DataFrames devolvidos são compartilhados entre sessões: quem for
+# alterá-los deve trabalhar sobre uma cópia.
+class CacheDataFrames:
+    def __init__(self, limite_bytes):
+        self.limite_bytes = limite_bytes
+        self._itens = OrderedDict()  # caminho -> (assinatura, df, bytes)
+        self._total = 0
+        self._trava = threading.Lock()
+        self._travas_arquivo = {}
+        # ligado pelo vigia de arquivos (vigia.py): quem pede um arquivo que
+        # mudou recebe a versão anterior enquanto a nova é lida em segundo plano
+        self.renovacao_externa = False
+
+    @staticmethod
+    def assinatura(caminho):
+        info = os.stat(caminho)
+        return (info.st_size, info.st_mtime_ns)
+
+    def _buscar(self, caminho, assinatura):
+        with self._trava:
+            item = self._itens.get(caminho)
+            if item is not None and item[0] == assinatura:
+                self._itens.move_to_end(caminho)
+                return item[1]
+        return None
+
+    def _anterior(self, caminho):
+        with self._trava:
+            item = self._itens.get(caminho)
+            return item[1] if item is not None else None
+
+    # aceitar_antigo: None = segue renovacao_externa
+    def obter(self, caminho, leitor=ler_relatorio, aceitar_antigo=None):
+        caminho = os.path.abspath(caminho)
+        assinatura = self.assinatura(caminho)
+
+        df = self._buscar(caminho, assinatura)
+        if df is not None:
+            return df
+        if self.renovacao_externa if aceitar_antigo is None else aceitar_antigo:
+            df = self._anterior(caminho)
+            if df is not None:
+                return df
+
+        # uma leitura por arquivo de cada vez: sessões concorrentes esperam
+        # a mesma leitura em vez de repetir o parse
+        with self._trava:
+            trava = self._travas_arquivo.setdefault(caminho, threading.Lock())
+        with trava:
+            df = self._buscar(caminho, assinatura)
+            if df is not None:
+                return df
+            df = leitor(caminho)
+            self._guardar(caminho, assinatura, df)
+        return df
+
+    def _guardar(self, caminho, assinatura, df):
+        tamanho = int(df.memory_usage(deep=True).sum())
+        with self._trava:
+            antigo = self._itens.pop(caminho, None)
+            if antigo is not None:
+                self._total -= antigo[2]
+            self._itens[caminho] = (assinatura, df, tamanho)
+            self._total += tamanho
+            # descarta os menos usados até caber no limite (mantém sempre o atual)
+            while self._total > self.limite_bytes and len(self._itens) > 1:
+                _, (_, _, liberado) = self._itens.popitem(last=False)
+                self._total -= liberado
+
+    def invalidar(self, caminho=None):
+        with self._trava:
+            if caminho is None:
+                self._itens.clear()
+                self._total = 0
+                return
+            item = self._itens.pop(os.path.abspath(caminho), None)
+            if item is not None:
+                self._total -= item[2]
+
+    def resumo(self):
+        with self._trava:
+            return {
+                "arquivos": len(self._itens),
+                "bytes": self._total,
+                "limite_bytes": self.limite_bytes,
+            }
+
+
+cache = CacheDataFrames(CACHE_LIMITE_MB * 1024 * 1024)
+
+def carregar(caminho):
+    return cache.obter(caminho)
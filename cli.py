@@ -0,0 +1,177 @@
+import argparse
+import glob
+import os
+import time
+
+from anomalias import NIVEL_PADRAO
+from carregamento import gerar_colunar, memoria
+from historico import DIMENSOES, ler_historico, matriz_series
+
+# -------------------------
+# TAREFAS EM LOTE
+# -------------------------
+# Uso: python cli.py <comando> [opções]
+
+def _expandir(caminhos):
+    arquivos = []
+    for caminho in caminhos:
+        if os.path.isdir(caminho):
+            arquivos.extend(sorted(glob.glob(os.path.join(caminho, "*.txt"))))
+        else:
+            arquivos.append(caminho)
+    return arquivos
+
+def cmd_converter(args):
+    for arq in _expandir(args.caminhos):
+        inicio = time.perf_counter()
+        destino = gerar_colunar(arq, forcar=args.forcar)
+        linha = f"{arq} -> {destino} ({time.perf_counter() - inicio:.2f}s)"
+        uso = memoria.get(os.path.abspath(arq))
+        if uso:
+            linha += f", memória {uso['antes'] / 2**20:.2f} MB -> {uso['depois'] / 2**20:.2f} MB"
+        print(linha)
+
+def cmd_previsoes(args):
+    # importa aqui: o Prophet só é necessário neste comando
+    from previsao import ARQUIVO_CATALOGO, prever_catalogo, salvar_catalogo
+
+    tabela, erros = ler_historico(args.historico)
+    for arq, e in erros:
+        print(f"Erro ao ler {arq}: {e}")
+
+    inicio = time.perf_counter()
+    catalogo, erros = prever_catalogo(tabela, args.dimensoes, periodos=args.periodos, workers=args.workers)
+    for chave, e in erros:
+        print(f"Erro ao prever a série {chave}: {e}")
+    destino = salvar_catalogo(catalogo, args.saida or ARQUIVO_CATALOGO)
+    series = catalogo.groupby(["dimensao", "valor"]).ngroups
+    print(f"{series} séries previstas em {time.perf_counter() - inicio:.1f}s -> {destino}")
+
+def cmd_avaliar(args):
+    from previsores import avaliar, obter_previsor
+
+    tabela, _ = ler_historico(args.historico)
+    meses, chaves, Y = matriz_series(tabela, args.dimensoes)
+    if args.limite:
+        Y = Y[:args.limite]
+    previsores = [obter_previsor(nome) for nome in args.previsores]
+    resultado = avaliar(previsores, meses, Y, horizonte=args.horizonte)
+    print(resultado.to_string(index=False))
+
+def cmd_pacote(args):
+    from pacote import gerar_pacote
+    from registro import registro
+
+    if args.todos:
+        alvos = [(p.arquivo, p.pasta_historico) for _, p in sorted(registro.particoes().items())]
+    else:
+        alvos = [(args.relatorio, args.historico)]
+
+    for relatorio, pasta_historico in alvos:
+        inicio = time.perf_counter()
+        pasta, erros = gerar_pacote(
+            relatorio, pasta_historico, args.saida,
+            dimensoes=args.dimensoes, periodos=args.periodos, workers=args.workers,
+        )
+        for etapa, item, e in erros:
+            print(f"Erro ({etapa}) em {item}: {e}")
+        print(f"Pacote gerado em {time.perf_counter() - inicio:.1f}s -> {pasta}")
+
+def cmd_anomalias(args):
+    from anomalias import detectar_anomalias
+
+    tabela, _ = ler_historico(args.historico)
+    inicio = time.perf_counter()
+    opcoes = {"limiar": args.limiar, "valor_minimo": args.valor_minimo}
+    resultado = detectar_anomalias(tabela, args.nivel, args.metrica, **{k: v for k, v in opcoes.items() if v is not None})
+    series = resultado[args.nivel].drop_duplicates().shape[0]
+    print(f"{len(resultado)} meses atípicos em {series} séries ({time.perf_counter() - inicio:.2f}s)")
+    if args.saida:
+        resultado.to_csv(args.saida, sep=";", decimal=",", index=False)
+        print(f"-> {args.saida}")
+    else:
+        print(resultado.head(args.limite).to_string(index=False))
+
+def cmd_benchmark(args):
+    import benchmark
+
+    if args.comparar:
+        resultado = benchmark.comparar(*args.comparar)
+        print(resultado.to_string(index=False))
+        return
+    saida, relatorio = benchmark.executar(
+        linhas=args.linhas, meses=args.meses, linhas_historico=args.linhas_historico,
+        formato=args.formato, backends=args.backends, previsores=args.previsores,
+        repeticoes=args.repeticoes, saida=args.saida, manter=args.manter, semente=args.semente,
+    )
+    referencias = benchmark.comparar_referencias(relatorio)
+    if len(referencias):
+        print("código original / atual:")
+        print(referencias.to_string(index=False))
+    print(f"{len(relatorio['resultados'])} medições em {relatorio['duracao_s']:.1f}s -> {saida}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tarefas em lote do Dashboard de Despesas")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("converter", help="gera as cópias colunares (.arrow) das exportações de texto")
+    p.add_argument("caminhos", nargs="*", default=["dados", "dados/historico"])
+    p.add_argument("--forcar", action="store_true", help="regera mesmo se a cópia estiver atualizada")
+    p.set_defaults(func=cmd_converter)
+
+    p = sub.add_parser("previsoes", help="prevê todas as funções (e/ou subfunções) em paralelo")
+    p.add_argument("--historico", default="dados/historico")
+    p.add_argument("--dimensoes", nargs="+", default=["funcao"], choices=list(DIMENSOES))
+    p.add_argument("--periodos", type=int, default=2)
+    p.add_argument("--workers", type=int, default=None, help="processos paralelos (padrão: todos os núcleos)")
+    p.add_argument("--saida", default=None, help="arquivo .arrow do catálogo")
+    p.set_defaults(func=cmd_previsoes)
+
+    p = sub.add_parser("avaliar", help="compara tempo de ajuste e erro de backtest dos previsores")
+    p.add_argument("--historico", default="dados/historico")
+    p.add_argument("--dimensoes", nargs="+", default=["funcao"], choices=list(DIMENSOES))
+    p.add_argument("--previsores", nargs="+", default=["numpy", "prophet"])
+    p.add_argument("--horizonte", type=int, default=2, help="meses finais separados para o backtest")
+    p.add_argument("--limite", type=int, default=0, help="avalia só as primeiras N séries")
+    p.set_defaults(func=cmd_avaliar)
+
+    p = sub.add_parser("pacote", help="pré-calcula agregados e previsões do dashboard em um pacote versionado")
+    p.add_argument("--relatorio", default="dados/Relatorio.txt")
+    p.add_argument("--historico", default="dados/historico")
+    p.add_argument("--dimensoes", nargs="+", default=["funcao"], choices=list(DIMENSOES))
+    p.add_argument("--periodos", type=int, default=2)
+    p.add_argument("--workers", type=int, default=None, help="processos paralelos (padrão: todos os núcleos)")
+    p.add_argument("--todos", action="store_true", help="gera um pacote para cada entidade/ano da pasta de dados")
+    p.add_argument("--saida", default=None, help="pasta dos pacotes (padrão: .cache/pacote ao lado do relatório)")
+    p.set_defaults(func=cmd_pacote)
+
+    p = sub.add_parser("anomalias", help="relatório de meses atípicos por série (z-score robusto)")
+    p.add_argument("--historico", default="dados/historico")
+    p.add_argument("--nivel", nargs="+", default=list(NIVEL_PADRAO), choices=list(DIMENSOES))
+    p.add_argument("--metrica", default="pago", choices=["empenhado", "liquidado", "pago"])
+    p.add_argument("--limiar", type=float, default=None, help="|z| mínimo (padrão: DASHBOARD_LIMIAR_ANOMALIA)")
+    p.add_argument("--valor-minimo", type=float, default=None, help="desvio mínimo em R$")
+    p.add_argument("--limite", type=int, default=30, help="linhas exibidas (sem --saida)")
+    p.add_argument("--saida", default=None, help="grava o relatório completo em CSV")
+    p.set_defaults(func=cmd_anomalias)
+
+    p = sub.add_parser("benchmark", help="mede leitura, filtros, agregações e previsões em exportações sintéticas")
+    p.add_argument("--linhas", nargs="+", type=int, default=[10**3, 10**4, 10**5], help="tamanhos do relatório (10³ a 10⁷)")
+    p.add_argument("--meses", nargs="+", type=int, default=[12], help="meses do histórico sintético")
+    p.add_argument("--linhas-historico", type=int, default=10**4, help="linhas de cada arquivo mensal")
+    p.add_argument("--formato", default="ponto", choices=["ponto", "virgula"], help="separador decimal dos valores")
+    p.add_argument("--backends", nargs="+", default=["pandas"], choices=["pandas", "duckdb"])
+    p.add_argument("--previsores", nargs="+", default=["numpy"])
+    p.add_argument("--repeticoes", type=int, default=3)
+    p.add_argument("--semente", type=int, default=0)
+    p.add_argument("--manter", action="store_true", help="não apaga os arquivos sintéticos ao final")
+    p.add_argument("--saida", default=None, help="arquivo JSON (padrão: dados/.cache/benchmarks/benchmark_<data>.json)")
+    p.add_argument("--comparar", nargs=2, metavar=("REFERENCIA", "ATUAL"), help="compara dois resultados já gravados")
+    p.set_defaults(func=cmd_benchmark)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime
+
+import pyarrow as pa
+
+from desempenho import medir
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+# -------------------------
+# CONFIG
+# -------------------------
+# pasta dos datasets compartilhados entre os processos do servidor (ex.:
+# /dev/shm/dashboard, memória compartilhada; ou uma pasta em disco, que o
+# sistema mantém no cache de páginas). Vazio = cada processo com sua cópia.
+PASTA_COMPARTILHADA = os.environ.get("DASHBOARD_COMPARTILHADO", "")
+# versões anteriores mantidas ao lado da atual (processos que ainda não
+# trocaram de versão continuam com o mapeamento da antiga)
+MANTER_VERSOES = 1
+ARQUIVO_ATUAL = "ATUAL"
+
+logger = logging.getLogger(__name__)
+
+def ativo():
+    return bool(PASTA_COMPARTILHADA)
+
+# -------------------------
+# FUNÇÕES AUXILIARES
+# -------------------------
+def _resumo(valor):
+    return hashlib.sha1(json.dumps(valor, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+# dados/Guaramirim/2025/Relatorio.txt -> <pasta>/Relatorio.txt-<hash do caminho>
+def pasta_dataset(chave):
+    nome = re.sub(r"[^\w.-]+", "_", os.path.basename(str(chave).rstrip(os.sep)))[:40]
+    return os.path.join(PASTA_COMPARTILHADA, f"{nome}-{_resumo(os.path.abspath(str(chave)))}")
+
+# um processo de cada vez publica na pasta do dataset; os outros esperam
+# e usam o que ele publicou
+@contextmanager
+def _travar(pasta):
+    with open(os.path.join(pasta, ".trava"), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def _versao_atual(pasta):
+    try:
+        with open(os.path.join(pasta, ARQUIVO_ATUAL), encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+# Tabela Arrow sobre o arquivo mapeado em memória: os buffers das colunas
+# apontam para as páginas do arquivo (as mesmas em todos os processos)
+def _mapear(arquivo):
+    try:
+        return pa.ipc.open_file(pa.memory_map(arquivo)).read_all()
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None
+
+def _gravar(tabela, arquivo):
+    temporario = f"{arquivo}.{os.getpid()}.tmp"
+    with pa.OSFile(temporario, "wb") as f:
+        with pa.ipc.new_file(f, tabela.schema) as escritor:
+            escritor.write_table(tabela)
+    os.replace(temporario, arquivo)
+
+# Aponta ATUAL para a nova versão e apaga as antigas. Apagar um arquivo
+# ainda mapeado por outro processo é seguro: o mapeamento continua válido
+# e a memória é liberada quando o último processo soltar a versão.
+def _trocar_versao(pasta, nome):
+    with open(os.path.join(pasta, f"{ARQUIVO_ATUAL}.tmp"), "w", encoding="utf-8") as f:
+        f.write(nome)
+    os.replace(os.path.join(pasta, f"{ARQUIVO_ATUAL}.tmp"), os.path.join(pasta, ARQUIVO_ATUAL))
+    antigas = sorted(
+        (os.path.join(pasta, arquivo) for arquivo in os.listdir(pasta)
+         if arquivo.endswith((".arrow", ".tmp")) and not arquivo.startswith(nome)),
+        key=os.path.getmtime, reverse=True,
+    )
+    for arquivo in antigas[MANTER_VERSOES:]:
+        try:
+            os.remove(arquivo)
+        except OSError:
+            pass
+
+# DataFrame sobre a tabela mapeada: colunas numéricas (valores, códigos,
+# datas) ficam sem cópia e somente leitura; só o que o pandas precisa
+# converter (textos, códigos das categorias) é copiado
+def _para_pandas(tabela):
+    meta = json.loads((tabela.schema.metadata or {}).get(b"compartilhado", b"{}"))
+    return tabela.to_pandas(split_blocks=True), meta.get("metadados", {})
+
+# -------------------------
+# PUBLICAÇÃO E LEITURA
+# -------------------------
+# DataFrame `chave` (caminho do arquivo ou da pasta de origem) na versão
+# `versao` (assinaturas da origem). O primeiro processo a pedir uma versão
+# chama gerar() -> (df, metadados), grava o Arrow IPC e troca ATUAL; os
+# demais, e os que iniciarem depois, só mapeiam o arquivo. Devolve
+# (df, metadados); os DataFrames são somente leitura.
+def obter(chave, versao, gerar):
+    pasta = pasta_dataset(chave)
+    nome = _resumo(versao)
+    arquivo = os.path.join(pasta, f"{nome}.arrow")
+
+    tabela = _mapear(arquivo)
+    if tabela is not None:
+        return _para_pandas(tabela)
+
+    try:
+        os.makedirs(pasta, exist_ok=True)
+    except OSError:
+        logger.warning("Dataset compartilhado indisponível em %s; lendo só neste processo", pasta, exc_info=True)
+        return gerar()
+
+    with _travar(pasta):
+        # outro processo pode ter publicado enquanto este esperava
+        tabela = _mapear(arquivo)
+        if tabela is not None:
+            return _para_pandas(tabela)
+
+        df, metadados = gerar()
+        with medir("publicação compartilhada", len(df)):
+            tabela = pa.Table.from_pandas(df, preserve_index=False)
+            meta = dict(tabela.schema.metadata or {})
+            meta[b"compartilhado"] = json.dumps({
+                "chave": os.path.abspath(str(chave)),
+                "versao": nome,
+                "publicado_em": datetime.now().isoformat(timespec="seconds"),
+                "metadados": metadados,
+            }, default=str).encode()
+            try:
+                _gravar(tabela.replace_schema_metadata(meta), arquivo)
+                _trocar_versao(pasta, nome)
+            except OSError:
+                # ex.: /dev/shm cheio; segue com a cópia deste processo
+                logger.warning("Não foi possível publicar %s em %s", chave, pasta, exc_info=True)
+                return df, metadados
+        logger.info("%s: versão %s publicada em %s (%.1f MB)", chave, nome, pasta, os.path.getsize(arquivo) / 2**20)
+
+    tabela = _mapear(arquivo)
+    return _para_pandas(tabela) if tabela is not None else (df, metadados)
+
+# conjuntos publicados: pasta -> versão atual (barra lateral)
+def publicados():
+    if not ativo() or not os.path.isdir(PASTA_COMPARTILHADA):
+        return {}
+    return {
+        nome: _versao_atual(os.path.join(PASTA_COMPARTILHADA, nome))
+        for nome in sorted(os.listdir(PASTA_COMPARTILHADA))
+        if os.path.isdir(os.path.join(PASTA_COMPARTILHADA, nome))
+    }
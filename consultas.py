@@ -0,0 +1,161 @@
+import logging
+import os
+
+import pyarrow.dataset as ds
+
+from carregamento import NUMERIC_COLS, caminho_colunar, gerar_colunar
+from cubo import memo_por_dataframe, obter_cubo
+
+try:
+    import duckdb
+except ImportError:  # backend opcional
+    duckdb = None
+
+# -------------------------
+# CONFIG
+# -------------------------
+# "pandas" (referência, sobre o cubo em memória) ou "duckdb"
+BACKEND_CONSULTAS = os.environ.get("DASHBOARD_BACKEND", "pandas")
+
+logger = logging.getLogger(__name__)
+
+# -------------------------
+# API DE CONSULTAS
+# -------------------------
+# Todas as agregações do dashboard passam por esta API. filtros é sempre
+# {coluna: valor} com os nomes originais das colunas do relatório.
+#   totais(filtros)                    -> {medida: soma}
+#   total(medida, filtros)             -> soma de uma medida
+#   agregar(dim, medidas, filtros)     -> DataFrame dim + medidas
+#   por_funcao(filtros, metricas)      -> agregar pela coluna de função
+#   top_n(dim, metrica, n, filtros)    -> n maiores valores de dim por metrica
+class Consultas:
+    nome = ""
+
+    def __init__(self, dimensoes, medidas, col_funcao):
+        self.dimensoes = [d for d in dimensoes if d]
+        self.medidas = [m for m in medidas if m]
+        self.col_funcao = col_funcao
+
+    def totais(self, filtros=None):
+        raise NotImplementedError
+
+    def agregar(self, dim, medidas=None, filtros=None):
+        raise NotImplementedError
+
+    def total(self, medida, filtros=None):
+        if medida not in self.medidas:
+            return 0.0
+        return self.totais(filtros)[medida]
+
+    def por_funcao(self, filtros=None, metricas=None):
+        return self.agregar(self.col_funcao, metricas, filtros)
+
+    def top_n(self, dim, metrica, n, filtros=None):
+        return self.agregar(dim, [metrica], filtros).sort_values(metrica, ascending=False).head(n)
+
+# -------------------------
+# PANDAS (REFERÊNCIA)
+# -------------------------
+class ConsultasPandas(Consultas):
+    nome = "pandas"
+
+    # cubo: já pronto (ex.: lido do pacote pré-calculado); senão, do df
+    def __init__(self, df, dimensoes, medidas, col_funcao, cubo=None):
+        super().__init__(dimensoes, medidas, col_funcao)
+        self.cubo = cubo or obter_cubo(df, self.dimensoes, self.medidas)
+        self.dimensoes = self.cubo.dimensoes
+        self.medidas = self.cubo.medidas
+
+    def totais(self, filtros=None):
+        return self.cubo.totais(filtros).to_dict()
+
+    def total(self, medida, filtros=None):
+        return self.cubo.total(medida, filtros)
+
+    def agregar(self, dim, medidas=None, filtros=None):
+        return self.cubo.agregar(dim, medidas, filtros)
+
+# -------------------------
+# DUCKDB (OPCIONAL)
+# -------------------------
+# Consulta direto a cópia colunar (.arrow) do relatório, sem montar o
+# DataFrame: o DuckDB lê só as colunas usadas (projeção) e aplica os
+# filtros na varredura, em várias threads.
+class ConsultasDuckDB(Consultas):
+    nome = "duckdb"
+
+    def __init__(self, caminho_arrow, dimensoes, medidas, col_funcao):
+        super().__init__(dimensoes, medidas, col_funcao)
+        self._dataset = ds.dataset(caminho_arrow, format="feather")
+        colunas = set(self._dataset.schema.names)
+        self.dimensoes = [d for d in self.dimensoes if d in colunas]
+        self.medidas = [m for m in self.medidas if m in colunas]
+        self._con = duckdb.connect()
+
+    @staticmethod
+    def _id(coluna):
+        return '"' + coluna.replace('"', '""') + '"'
+
+    def _where(self, filtros):
+        filtros = {c: v for c, v in (filtros or {}).items() if c in self.dimensoes}
+        if not filtros:
+            return "", []
+        return " WHERE " + " AND ".join(f"{self._id(c)} = ?" for c in filtros), list(filtros.values())
+
+    def _consultar(self, sql, parametros):
+        # um cursor por consulta: a conexão é compartilhada entre sessões
+        # (o registro do dataset é por cursor e não copia dados)
+        with self._con.cursor() as cur:
+            cur.register("relatorio", self._dataset)
+            return cur.execute(sql, parametros).fetchdf()
+
+    def totais(self, filtros=None):
+        where, parametros = self._where(filtros)
+        somas = ", ".join(f"COALESCE(SUM({self._id(m)}), 0) AS {self._id(m)}" for m in self.medidas)
+        return self._consultar(f"SELECT {somas} FROM relatorio{where}", parametros).iloc[0].to_dict()
+
+    def agregar(self, dim, medidas=None, filtros=None):
+        medidas = [m for m in (medidas or self.medidas) if m in self.medidas]
+        where, parametros = self._where(filtros)
+        somas = ", ".join(f"SUM({self._id(m)}) AS {self._id(m)}" for m in medidas)
+        sql = (
+            f"SELECT {self._id(dim)}, {somas} FROM relatorio{where} "
+            f"GROUP BY {self._id(dim)} HAVING {self._id(dim)} IS NOT NULL ORDER BY {self._id(dim)}"
+        )
+        return self._consultar(sql, parametros)
+
+    def top_n(self, dim, metrica, n, filtros=None):
+        where, parametros = self._where(filtros)
+        sql = (
+            f"SELECT {self._id(dim)}, SUM({self._id(metrica)}) AS {self._id(metrica)} FROM relatorio{where} "
+            f"GROUP BY {self._id(dim)} HAVING {self._id(dim)} IS NOT NULL "
+            f"ORDER BY {self._id(metrica)} DESC LIMIT {int(n)}"
+        )
+        return self._consultar(sql, parametros)
+
+# -------------------------
+# ESCOLHA DO BACKEND
+# -------------------------
+def _construir(df, caminho, expected, backend):
+    dimensoes = [expected.get(n) for n in ["funcao descricao", "subfuncao descricao", "descricao categoria economica"]]
+    medidas = [expected.get(n) for n in NUMERIC_COLS]
+    col_funcao = expected.get("funcao descricao")
+
+    if backend == "duckdb":
+        if duckdb is None:
+            logger.warning("DASHBOARD_BACKEND=duckdb, mas o pacote duckdb não está instalado; usando pandas")
+        else:
+            try:
+                gerar_colunar(caminho)
+                return ConsultasDuckDB(caminho_colunar(caminho), dimensoes, medidas, col_funcao)
+            except Exception:
+                logger.exception("Falha ao iniciar o DuckDB; usando pandas")
+    return ConsultasPandas(df, dimensoes, medidas, col_funcao)
+
+# Um backend por DataFrame carregado (o DuckDB lê a cópia colunar do mesmo
+# arquivo, que é regerada junto com ele).
+def obter_consultas(df, caminho, expected, backend=None):
+    backend = backend or BACKEND_CONSULTAS
+    chave = ("consultas", backend, os.path.abspath(caminho))
+    return memo_por_dataframe(df, chave, lambda: _construir(df, caminho, expected, backend))
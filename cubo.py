@@ -0,0 +1,129 @@
+import threading
+import weakref
+
+import numpy as np
+
+# -------------------------
+# CUBO PRÉ-AGREGADO
+# -------------------------
+# Soma das medidas (colunas de valores) por combinação das dimensões
+# (função x subfunção x categoria econômica). Cards, ranking e gráficos
+# saem do cubo por recorte + soma, sem varrer as linhas do relatório.
+class Cubo:
+    def __init__(self, celulas, dimensoes, medidas):
+        self.celulas = celulas
+        self.dimensoes = list(dimensoes)
+        self.medidas = list(medidas)
+
+    @classmethod
+    def construir(cls, df, dimensoes, medidas):
+        dimensoes = [d for d in dimensoes if d and d in df.columns]
+        medidas = [m for m in medidas if m and m in df.columns]
+        if dimensoes:
+            celulas = df.groupby(dimensoes, dropna=False, observed=True, sort=False)[medidas].sum().reset_index()
+        else:
+            celulas = df[medidas].sum().to_frame().T
+        return cls(celulas, dimensoes, medidas)
+
+    # filtros: {coluna: valor}; colunas que não são dimensões do cubo são ignoradas
+    def recorte(self, filtros=None):
+        celulas = self.celulas
+        for dim, valor in (filtros or {}).items():
+            if dim in self.dimensoes:
+                celulas = celulas[celulas[dim] == valor]
+        return celulas
+
+    def totais(self, filtros=None):
+        return self.recorte(filtros)[self.medidas].sum()
+
+    def total(self, medida, filtros=None):
+        if medida not in self.medidas:
+            return 0.0
+        return self.recorte(filtros)[medida].sum()
+
+    def agregar(self, dim, medidas=None, filtros=None):
+        medidas = [m for m in (medidas or self.medidas) if m in self.medidas]
+        return self.recorte(filtros).groupby(dim, observed=True)[medidas].sum().reset_index()
+
+# -------------------------
+# ÍNDICE DOS FILTROS EM CASCATA
+# -------------------------
+# Para as colunas dos filtros (em ordem: função -> subfunção -> categoria):
+# - hierarquia: combinações existentes de valores, de onde saem as opções
+#   de cada filtro dada a seleção dos anteriores (com memo por seleção)
+# - postings: posições das linhas de cada valor; as linhas filtradas são a
+#   interseção das listas dos valores selecionados
+class IndiceFiltros:
+    def __init__(self, df, colunas):
+        self.colunas = [c for c in colunas if c and c in df.columns]
+        self.total_linhas = len(df)
+        self.combinacoes = df[self.colunas].drop_duplicates().reset_index(drop=True)
+        self.postings = {
+            col: {valor: np.asarray(pos) for valor, pos in df.groupby(col, observed=True).indices.items()}
+            for col in self.colunas
+        }
+        self._opcoes = {}
+        self._trava = threading.Lock()
+
+    # selecao: {coluna: valor} só com os filtros ativos
+    def opcoes(self, coluna, selecao=None):
+        if coluna not in self.colunas:
+            return []
+        anteriores = self.colunas[:self.colunas.index(coluna)]
+        chave = (coluna,) + tuple((selecao or {}).get(c) for c in anteriores)
+        with self._trava:
+            if chave in self._opcoes:
+                return self._opcoes[chave]
+
+        combinacoes = self.combinacoes
+        for c, valor in zip(anteriores, chave[1:]):
+            if valor is not None:
+                combinacoes = combinacoes[combinacoes[c] == valor]
+        opcoes = sorted(combinacoes[coluna].dropna().unique())
+        with self._trava:
+            self._opcoes[chave] = opcoes
+        return opcoes
+
+    def limpar_memo(self):
+        with self._trava:
+            self._opcoes.clear()
+
+    # posições das linhas que atendem à seleção (None = todas)
+    def linhas(self, selecao=None):
+        resultado = None
+        for coluna, valor in (selecao or {}).items():
+            if coluna not in self.postings:
+                continue
+            pos = self.postings[coluna].get(valor, np.empty(0, dtype=np.intp))
+            resultado = pos if resultado is None else np.intersect1d(resultado, pos, assume_unique=True)
+        return resultado
+
+# -------------------------
+# ESTRUTURAS POR DATASET
+# -------------------------
+# Cubo e índice são calculados uma vez por DataFrame carregado: enquanto o
+# cache de carregamento devolver o mesmo objeto, são reaproveitados entre
+# reexecuções e sessões.
+_por_dataframe = {}
+_trava = threading.Lock()
+
+def memo_por_dataframe(df, chave, construir):
+    chave = (id(df),) + chave
+    with _trava:
+        item = _por_dataframe.get(chave)
+        if item is not None and item[0]() is df:
+            return item[1]
+
+    valor = construir()
+    with _trava:
+        # descarta estruturas de DataFrames que já saíram da memória
+        for k in [k for k, (ref, _) in _por_dataframe.items() if ref() is None]:
+            del _por_dataframe[k]
+        _por_dataframe[chave] = (weakref.ref(df), valor)
+    return valor
+
+def obter_cubo(df, dimensoes, medidas):
+    return memo_por_dataframe(df, ("cubo", tuple(dimensoes), tuple(medidas)), lambda: Cubo.construir(df, dimensoes, medidas))
+
+def obter_indice(df, colunas):
+    return memo_por_dataframe(df, ("indice", tuple(colunas)), lambda: IndiceFiltros(df, colunas))
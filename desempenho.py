@@ -0,0 +1,239 @@
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows: sem getrusage
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# -------------------------
+# CONFIG
+# -------------------------
+# medições guardadas por etapa (as mais recentes), no total e por sessão
+AMOSTRAS_ETAPA = int(os.environ.get("DASHBOARD_METRICAS_AMOSTRAS", "2000"))
+AMOSTRAS_SESSAO = 200
+# sessões acompanhadas (as mais antigas saem primeiro)
+MAX_SESSOES = 200
+# arquivo de métricas em texto (formato Prometheus); vazio = não grava
+ARQUIVO_METRICAS = os.environ.get("DASHBOARD_METRICAS_ARQUIVO", os.path.join("dados", ".cache", "metricas.prom"))
+# intervalo mínimo entre duas gravações do arquivo
+GRAVACAO_METRICAS_S = 30
+PERCENTIS = (50, 90, 95, 99)
+
+# -------------------------
+# TEMPO DE INICIALIZAÇÃO
+# -------------------------
+# Registra, uma vez por processo, quanto a primeira execução do app gastou
+# em cada etapa (importações, leitura, renderização...). Reexecuções do
+# script não alteram o relatório.
+class Inicializacao:
+    def __init__(self):
+        self.etapas = {}
+        self.concluida = False
+        self._trava = threading.Lock()
+
+    def marcar(self, etapa, inicio):
+        with self._trava:
+            if not self.concluida:
+                self.etapas.setdefault(etapa, time.perf_counter() - inicio)
+
+    def concluir(self, inicio):
+        with self._trava:
+            if self.concluida:
+                return False
+            self.etapas["total"] = time.perf_counter() - inicio
+            self.concluida = True
+        logger.info("Inicialização: %s", ", ".join(f"{k}={v:.2f}s" for k, v in self.etapas.items()))
+        return True
+
+    def relatorio(self):
+        with self._trava:
+            return dict(self.etapas)
+
+
+inicializacao = Inicializacao()
+
+# -------------------------
+# AQUECIMENTO EM SEGUNDO PLANO
+# -------------------------
+_aquecidos = set()
+_trava_aquecimento = threading.Lock()
+
+def _importar(modulos):
+    for nome in modulos:
+        inicio = time.perf_counter()
+        try:
+            importlib.import_module(nome)
+        except ImportError:
+            logger.warning("Aquecimento: módulo %s indisponível", nome)
+            continue
+        with inicializacao._trava:
+            inicializacao.etapas[f"aquecimento {nome}"] = time.perf_counter() - inicio
+
+# Importa dependências pesadas em uma thread, depois da primeira tela, para
+# que o primeiro uso real não pague a importação.
+def aquecer_em_segundo_plano(modulos):
+    with _trava_aquecimento:
+        pendentes = [m for m in modulos if m not in _aquecidos]
+        _aquecidos.update(pendentes)
+    if pendentes:
+        threading.Thread(target=_importar, args=(pendentes,), name="aquecimento", daemon=True).start()
+
+# -------------------------
+# INSTRUMENTAÇÃO (ETAPAS)
+# -------------------------
+# memória residente do processo (Linux: /proc; senão o pico do processo;
+# None onde não há como medir, ex.: Windows)
+_PAGINA = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def memoria_residente():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGINA
+    except (OSError, ValueError, IndexError):
+        if resource is None:
+            return None
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss: KB no Linux, bytes no macOS
+        return pico if sys.platform == "darwin" else pico * 1024
+
+def _rotulo(etapa):
+    return etapa.replace("\\", "\\\\").replace('"', '\\"')
+
+# Medições de cada etapa nomeada (duração, linhas, variação de memória),
+# no total do processo e por sessão do app. A sessão é a da thread que
+# está executando o script (iniciar_sessao); etapas medidas em outras
+# threads (vigia, previsões em lote) entram só no total. A memória é a do
+# processo inteiro: com sessões simultâneas, a variação é aproximada.
+class Metricas:
+    def __init__(self, amostras, amostras_sessao, max_sessoes):
+        self.amostras = amostras
+        self.amostras_sessao = amostras_sessao
+        self.max_sessoes = max_sessoes
+        self._etapas = {}   # etapa -> deque de (duração, linhas, memória)
+        self._totais = {}   # etapa -> [quantidade, soma das durações]
+        self._sessoes = {}  # sessão -> {etapa: deque}
+        self._local = threading.local()
+        self._trava = threading.Lock()
+        self._gravado = 0.0
+
+    def iniciar_sessao(self, sessao):
+        self._local.sessao = sessao
+
+    def registrar(self, etapa, duracao, linhas=None, memoria=None):
+        amostra = (duracao, np.nan if linhas is None else linhas, np.nan if memoria is None else memoria)
+        sessao = getattr(self._local, "sessao", None)
+        with self._trava:
+            self._etapas.setdefault(etapa, deque(maxlen=self.amostras)).append(amostra)
+            total = self._totais.setdefault(etapa, [0, 0.0])
+            total[0] += 1
+            total[1] += duracao
+            if sessao is not None:
+                if sessao not in self._sessoes and len(self._sessoes) >= self.max_sessoes:
+                    self._sessoes.pop(next(iter(self._sessoes)))
+                etapas = self._sessoes.setdefault(sessao, {})
+                etapas.setdefault(etapa, deque(maxlen=self.amostras_sessao)).append(amostra)
+
+    # with metricas.medir("etapa") as m: ...; m["linhas"] = n
+    @contextmanager
+    def medir(self, etapa, linhas=None):
+        info = {"linhas": linhas}
+        memoria = memoria_residente()
+        inicio = time.perf_counter()
+        try:
+            yield info
+        finally:
+            depois = memoria_residente()
+            variacao = None if memoria is None or depois is None else depois - memoria
+            self.registrar(etapa, time.perf_counter() - inicio, info["linhas"], variacao)
+
+    @staticmethod
+    def _resumo(etapas):
+        linhas = []
+        for etapa, amostras in etapas.items():
+            dados = np.array(amostras, dtype=float)
+            duracoes = dados[:, 0]
+            linha = {"etapa": etapa, "amostras": len(duracoes), "media_ms": float(duracoes.mean()) * 1000}
+            for p, v in zip(PERCENTIS, np.percentile(duracoes, PERCENTIS)):
+                linha[f"p{p}_ms"] = float(v) * 1000
+            linha["max_ms"] = float(duracoes.max()) * 1000
+            linha["linhas"] = float(np.nanmedian(dados[:, 1])) if not np.isnan(dados[:, 1]).all() else np.nan
+            linha["memoria_mb"] = float(np.nanmedian(dados[:, 2])) / 2**20 if not np.isnan(dados[:, 2]).all() else np.nan
+            linhas.append(linha)
+        return sorted(linhas, key=lambda l: -l["p95_ms"])
+
+    # percentis por etapa: do processo (sessao=None) ou de uma sessão
+    def resumo(self, sessao=None):
+        with self._trava:
+            etapas = self._etapas if sessao is None else self._sessoes.get(sessao, {})
+            copia = {etapa: list(amostras) for etapa, amostras in etapas.items()}
+        return self._resumo(copia)
+
+    def sessoes(self):
+        with self._trava:
+            return len(self._sessoes)
+
+    # texto no formato de exposição do Prometheus
+    def texto(self):
+        with self._trava:
+            totais = {etapa: list(total) for etapa, total in self._totais.items()}
+        saida = [
+            "# HELP dashboard_etapa_segundos Duração das etapas do app (amostras recentes).",
+            "# TYPE dashboard_etapa_segundos summary",
+        ]
+        resumo = {linha["etapa"]: linha for linha in self.resumo()}
+        for etapa, linha in sorted(resumo.items()):
+            rotulo = _rotulo(etapa)
+            for p in PERCENTIS:
+                saida.append(f'dashboard_etapa_segundos{{etapa="{rotulo}",quantile="{p / 100}"}} {linha[f"p{p}_ms"] / 1000:.6f}')
+            saida.append(f'dashboard_etapa_segundos_sum{{etapa="{rotulo}"}} {totais[etapa][1]:.6f}')
+            saida.append(f'dashboard_etapa_segundos_count{{etapa="{rotulo}"}} {totais[etapa][0]}')
+        saida.append("# HELP dashboard_etapa_linhas Linhas processadas pela etapa (mediana recente).")
+        saida.append("# TYPE dashboard_etapa_linhas gauge")
+        for etapa, linha in sorted(resumo.items()):
+            if not np.isnan(linha["linhas"]):
+                saida.append(f'dashboard_etapa_linhas{{etapa="{_rotulo(etapa)}"}} {linha["linhas"]:.0f}')
+        saida.append("# HELP dashboard_etapa_memoria_bytes Variação da memória residente na etapa (mediana recente).")
+        saida.append("# TYPE dashboard_etapa_memoria_bytes gauge")
+        for etapa, linha in sorted(resumo.items()):
+            if not np.isnan(linha["memoria_mb"]):
+                saida.append(f'dashboard_etapa_memoria_bytes{{etapa="{_rotulo(etapa)}"}} {linha["memoria_mb"] * 2**20:.0f}')
+        memoria = memoria_residente()
+        if memoria is not None:
+            saida.append(f"dashboard_memoria_residente_bytes {memoria}")
+        saida.append(f"dashboard_sessoes {self.sessoes()}")
+        return "\n".join(saida) + "\n"
+
+    # grava o arquivo de métricas (no máximo a cada GRAVACAO_METRICAS_S)
+    def exportar(self, caminho=None, forcar=False):
+        caminho = caminho if caminho is not None else ARQUIVO_METRICAS
+        if not caminho:
+            return None
+        with self._trava:
+            if not forcar and time.monotonic() - self._gravado < GRAVACAO_METRICAS_S:
+                return None
+            self._gravado = time.monotonic()
+        try:
+            os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+            temporario = f"{caminho}.{os.getpid()}.tmp"
+            with open(temporario, "w", encoding="utf-8") as f:
+                f.write(self.texto())
+            os.replace(temporario, caminho)
+        except OSError:
+            logger.warning("Não foi possível gravar as métricas em %s", caminho, exc_info=True)
+            return None
+        return caminho
+
+
+metricas = Metricas(AMOSTRAS_ETAPA, AMOSTRAS_SESSAO, MAX_SESSOES)
+medir = metricas.medir
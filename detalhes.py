@@ -0,0 +1,145 @@
+import io
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from carregamento import normalize
+from cubo import memo_por_dataframe
+
+# -------------------------
+# CONFIG
+# -------------------------
+TAMANHOS_PAGINA = [25, 50, 100, 250]
+# linhas por bloco na exportação CSV
+BLOCO_CSV = 20_000
+# consultas (seleção + busca + ordem) lembradas por DataFrame
+CONSULTAS_MEMORIA = 32
+
+# -------------------------
+# TABELA DETALHADA (LADO DO SERVIDOR)
+# -------------------------
+# Busca, ordenação e paginação são feitas aqui, sobre posições de linhas:
+# o navegador só recebe a página visível e as colunas escolhidas.
+# Para a busca, cada coluna de texto/código é guardada como códigos (no
+# menor tipo inteiro que comporta) + rótulos únicos normalizados, montados
+# na primeira busca; procurar um termo é comparar os rótulos (poucos) e
+# depois marcar as linhas pelos códigos.
+class TabelaDetalhada:
+    def __init__(self, df):
+        # referência fraca: a tabela não pode manter vivo um DataFrame que
+        # o cache de carregamento já descartou
+        self._df = weakref.ref(df)
+        self.colunas = list(df.columns)
+        # valores monetários não entram na busca
+        self.colunas_busca = [
+            col for col in self.colunas
+            if isinstance(df[col].dtype, pd.CategoricalDtype)
+            or pd.api.types.is_integer_dtype(df[col].dtype) or pd.api.types.is_object_dtype(df[col].dtype)
+        ]
+        self.rotulos = {}
+        self._consultas = OrderedDict()
+        self._trava = threading.Lock()
+
+    def _rotulos(self, col):
+        with self._trava:
+            if col in self.rotulos:
+                return self.rotulos[col]
+        serie = self.df[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            codigos, unicos = serie.cat.codes.to_numpy(), serie.cat.categories
+        else:
+            codigos, unicos = pd.factorize(serie)
+            # -1 = vazio: tipo com sinal
+            codigos = codigos.astype(next(t for t in (np.int8, np.int16, np.int32, np.int64) if len(unicos) < np.iinfo(t).max))
+        normalizados = np.array([normalize(str(v)) for v in unicos], dtype=object)
+        with self._trava:
+            self.rotulos[col] = (codigos, normalizados)
+        return codigos, normalizados
+
+    @property
+    def df(self):
+        return self._df()
+
+    def _buscar(self, termo):
+        mascara = np.zeros(len(self.df), dtype=bool)
+        for col in self.colunas_busca:
+            codigos, normalizados = self._rotulos(col)
+            achados = np.flatnonzero([termo in r for r in normalizados])
+            if len(achados):
+                mascara |= np.isin(codigos, achados)
+        return np.flatnonzero(mascara)
+
+    # linhas: posições já filtradas (None = todas); chave identifica a
+    # seleção que as gerou, para reaproveitar o resultado entre reexecuções
+    def consultar(self, linhas, chave=(), busca="", ordenar_por=None, decrescente=False):
+        termo = normalize(busca or "")
+        chave = (chave, termo, ordenar_por, decrescente)
+        with self._trava:
+            if chave in self._consultas:
+                self._consultas.move_to_end(chave)
+                return self._consultas[chave]
+
+        posicoes = np.arange(len(self.df)) if linhas is None else np.asarray(linhas)
+        if termo:
+            posicoes = np.intersect1d(posicoes, self._buscar(termo), assume_unique=True)
+        if ordenar_por in self.colunas and len(posicoes):
+            valores = self.df[ordenar_por].take(posicoes)
+            if isinstance(valores.dtype, pd.CategoricalDtype):
+                # ordem alfabética dos rótulos, não a ordem das categorias
+                valores = valores.astype(str)
+            ordem = np.argsort(valores.to_numpy(), kind="stable")
+            if decrescente:
+                ordem = ordem[::-1]
+            posicoes = posicoes[ordem]
+
+        with self._trava:
+            self._consultas[chave] = posicoes
+            while len(self._consultas) > CONSULTAS_MEMORIA:
+                self._consultas.popitem(last=False)
+        return posicoes
+
+    def pagina(self, posicoes, numero, tamanho, colunas=None):
+        inicio = (numero - 1) * tamanho
+        colunas = [c for c in (colunas or self.colunas) if c in self.colunas]
+        # linhas antes das colunas: copia só a página
+        return self.df.take(posicoes[inicio:inicio + tamanho])[colunas]
+
+    # CSV do resultado completo gerado em blocos (nunca a tabela inteira
+    # como um único texto)
+    def csv_em_blocos(self, posicoes, colunas=None, bloco=BLOCO_CSV):
+        colunas = [c for c in (colunas or self.colunas) if c in self.colunas]
+        df = self.df
+        yield df.head(0)[colunas].to_csv(sep=";", index=False).encode("utf-8-sig")
+        for inicio in range(0, len(posicoes), bloco):
+            parte = df.take(posicoes[inicio:inicio + bloco])[colunas]
+            yield parte.to_csv(sep=";", decimal=",", index=False, header=False).encode("utf-8")
+
+    def arquivo_csv(self, posicoes, colunas=None):
+        return ArquivoEmBlocos(self.csv_em_blocos(posicoes, colunas))
+
+# Arquivo somente leitura sobre um gerador de bytes: quem consome lê aos
+# poucos, e cada bloco só é gerado quando pedido
+class ArquivoEmBlocos(io.RawIOBase):
+    def __init__(self, blocos):
+        self._blocos = iter(blocos)
+        self._resto = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, destino):
+        while not self._resto:
+            try:
+                self._resto = memoryview(next(self._blocos))
+            except StopIteration:
+                return 0
+        n = min(len(destino), len(self._resto))
+        destino[:n] = self._resto[:n]
+        self._resto = self._resto[n:]
+        return n
+
+def obter_tabela(df):
+    return memo_por_dataframe(df, ("detalhes",), lambda: TabelaDetalhada(df))
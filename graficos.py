@@ -0,0 +1,83 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# -------------------------
+# CONFIG
+# -------------------------
+# figuras prontas mantidas em memória (compartilhadas entre sessões)
+FIGURAS_MEMORIA = int(os.environ.get("DASHBOARD_FIGURAS_MEMORIA", "64"))
+# casas decimais dos valores enviados ao navegador
+CASAS_DECIMAIS = 2
+
+logger = logging.getLogger(__name__)
+
+# -------------------------
+# PREPARO DOS DADOS
+# -------------------------
+# Arredonda as colunas numéricas com casas decimais (os centavos bastam
+# para os gráficos e o JSON fica bem menor)
+def arredondar(df, casas=CASAS_DECIMAIS):
+    df = df.copy()
+    for col in df.columns:
+        if pd.api.types.is_float_dtype(df[col].dtype):
+            df[col] = df[col].round(casas)
+    return df
+
+# n maiores valores de dim por valor, com o restante somado em "Outros"
+def top_n_outros(df, dim, valor, n=5, rotulo="Outros"):
+    df = df.sort_values(valor, ascending=False)
+    topo = df.head(n)
+    outros_valor = df[valor].iloc[n:].sum()
+    if outros_valor > 0:
+        outros_df = pd.DataFrame({dim: [rotulo], valor: [outros_valor]})
+        topo = pd.concat([topo[[dim, valor]], outros_df], ignore_index=True)
+    return topo
+
+# -------------------------
+# CACHE DE FIGURAS
+# -------------------------
+# Chave = conteúdo dos dados agregados + opções do gráfico. Enquanto os
+# dois não mudarem, a mesma figura (e o tamanho do JSON, medido uma vez)
+# é devolvida, sem montar o gráfico de novo.
+class CacheFiguras:
+    def __init__(self, limite=FIGURAS_MEMORIA):
+        self.limite = limite
+        self._figuras = OrderedDict()
+        self._trava = threading.Lock()
+
+    @staticmethod
+    def chave(dados, opcoes):
+        h = hashlib.sha256(repr(sorted(opcoes.items())).encode("utf-8"))
+        for df in dados:
+            h.update(repr(list(df.columns)).encode("utf-8"))
+            h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+        return h.hexdigest()
+
+    # dados: DataFrame (ou lista deles) já agregado/arredondado
+    # construir(*dados) -> figura plotly
+    def obter(self, dados, opcoes, construir):
+        dados = dados if isinstance(dados, (list, tuple)) else [dados]
+        chave = self.chave(dados, opcoes)
+        with self._trava:
+            if chave in self._figuras:
+                self._figuras.move_to_end(chave)
+                return self._figuras[chave]
+
+        import plotly.io as pio
+
+        fig = construir(*dados)
+        tamanho = len(pio.to_json(fig, validate=False))
+        logger.info("Gráfico %s: %.1f KB", opcoes.get("titulo", ""), tamanho / 1024)
+        with self._trava:
+            self._figuras[chave] = (fig, tamanho)
+            while len(self._figuras) > self.limite:
+                self._figuras.popitem(last=False)
+        return fig, tamanho
+
+
+cache = CacheFiguras()
@@ -0,0 +1,399 @@
+import glob
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import closing
+from datetime import datetime
+
+import pandas as pd
+
+import compartilhado
+from carregamento import NUMERIC_COLS, PASTA_COLUNAR, CacheDataFrames, cache, find_col, ler_arquivo
+from streaming import agregar_em_blocos, arquivo_grande
+
+# -------------------------
+# CONFIG
+# -------------------------
+# dimensões da tabela longa -> nome normalizado da coluna no relatório
+DIMENSOES = {
+    "funcao": "funcao descricao",
+    "subfuncao": "subfuncao descricao",
+    "categoria": "descricao categoria economica",
+    "programa": "programa descricao",
+    "acao": "acao descricao",
+    "fonte": "descricao da fonte",
+    "acao_codigo": "acao codigo",
+    "fonte_codigo": "fonte",
+}
+# dimensões de código -> dimensão com a descrição exibida (uma descrição
+# pode cobrir vários códigos: as séries são separadas pelo código)
+ROTULOS = {"acao_codigo": "acao", "fonte_codigo": "fonte"}
+
+# armazém incremental fica junto das cópias colunares da pasta
+PASTA_ARMAZEM = PASTA_COLUNAR
+# processos que leem os arquivos do histórico em paralelo (1 = sequencial)
+WORKERS_HISTORICO = int(os.environ.get("DASHBOARD_WORKERS_HISTORICO", "0")) or os.cpu_count()
+# abaixo disso (MB a ler) iniciar os processos custa mais que o parse
+PARALELO_MIN_MB = float(os.environ.get("DASHBOARD_PARALELO_MIN_MB", "16"))
+
+logger = logging.getLogger(__name__)
+
+MESES = {
+    "Jan": 1, "Fev": 2, "Mar": 3, "Abr": 4, "Mai": 5, "Jun": 6,
+    "Jul": 7, "Ago": 8, "Set": 9, "Out": 10, "Nov": 11, "Dez": 12
+}
+
+# -------------------------
+# FUNÇÕES AUXILIARES
+# -------------------------
+# mapeia mês/ano do nome do arquivo (ex.: JAN25.txt)
+def extrair_mes_ano(nome_arquivo):
+    nome = os.path.basename(nome_arquivo).split(".")[0]
+    mes = nome[:3].capitalize()
+    ano = int("20" + nome[-2:])
+    return datetime(ano, MESES.get(mes, 1), 1)
+
+# Cópia de backup: nome com sufixo depois de MMMAA (ex.: Jan25bkp.txt,
+# FEV25 copia.txt). Backups nunca substituem o arquivo do mês (JAN25.txt):
+# são registrados como "backup" e não chegam a ser lidos, mesmo que o
+# conteúdo seja diferente do arquivo canônico.
+def eh_backup(nome_arquivo):
+    nome = os.path.basename(nome_arquivo).split(".")[0]
+    return re.fullmatch(r"[A-Za-z]{3}\d{2}.+", nome) is not None
+
+def listar_arquivos(pasta):
+    return sorted(glob.glob(os.path.join(pasta, "*.txt")))
+
+# códigos lidos como número (ex.: 150070000000) ou texto -> texto
+def _codigo(serie):
+    return serie.astype("string").str.strip().str.replace(r"\.0$", "", regex=True)
+
+# -------------------------
+# INGESTÃO
+# -------------------------
+# Reduz um arquivo mensal às colunas da tabela longa:
+# mes x dimensões (função ... fonte) x oito colunas de valores
+def agregar_mes(df_mes, mes):
+    col_pago = find_col(df_mes.columns, "pago ate o mes")
+    if col_pago is None:
+        return None
+
+    dims = {}
+    for dim, norm in DIMENSOES.items():
+        orig = find_col(df_mes.columns, norm)
+        dims[dim] = df_mes[orig] if orig else pd.Series(None, index=df_mes.index, dtype=object)
+        if dim in ROTULOS:
+            dims[dim] = _codigo(dims[dim])
+
+    valores = {}
+    for ncol in NUMERIC_COLS:
+        orig = find_col(df_mes.columns, ncol)
+        valores[ncol] = df_mes[orig] if orig else pd.Series(0.0, index=df_mes.index)
+
+    base = pd.DataFrame({**dims, **valores})
+    agregado = base.groupby(list(DIMENSOES), dropna=False, sort=False, observed=True)[NUMERIC_COLS].sum().reset_index()
+    agregado.insert(0, "mes", pd.Timestamp(mes))
+    return agregado
+
+# leitura + agregação de um arquivo (roda nos processos do pool); arquivos
+# grandes são agregados em blocos, sem carregar todas as linhas
+def ler_mes(arq):
+    mes = pd.Timestamp(extrair_mes_ano(arq))
+    if arquivo_grande(arq):
+        colunas = list(DIMENSOES.values()) + NUMERIC_COLS
+        chaves = ["mes"] + list(DIMENSOES)
+        return mes, agregar_em_blocos(arq, lambda bloco: agregar_mes(bloco, mes), chaves, NUMERIC_COLS, colunas)
+    return mes, agregar_mes(ler_arquivo(arq), mes)
+
+def _sha256(caminho):
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+# Aplica `funcao` a cada item em paralelo; devolve {item: (resultado, erro)}.
+# Processos para o parse (CPU), threads para o que só lê disco; sem pool se
+# houver um item só ou um worker só.
+def _em_paralelo(funcao, itens, workers, processos):
+    resultados = {}
+
+    def executar(item):
+        try:
+            return funcao(item), None
+        except Exception as e:
+            return None, e
+
+    workers = min(workers, len(itens))
+    if workers <= 1:
+        return {item: executar(item) for item in itens}
+
+    if processos:
+        try:
+            # "spawn": não herda as threads do servidor do Streamlit
+            contexto = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=contexto) as pool:
+                futuros = {item: pool.submit(funcao, item) for item in itens}
+                for item, futuro in futuros.items():
+                    try:
+                        resultados[item] = (futuro.result(), None)
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        resultados[item] = (None, e)
+            return resultados
+        except (OSError, BrokenProcessPool):
+            logger.warning("Pool de processos indisponível; lendo o histórico em threads", exc_info=True)
+            resultados = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(itens, pool.map(executar, itens)))
+
+# -------------------------
+# ARMAZÉM INCREMENTAL (SQLITE)
+# -------------------------
+# Guarda os agregados mensais já calculados em dados/historico/.cache/historico.sqlite.
+# A cada sincronização só os arquivos novos ou alterados (tamanho/mtime) são
+# lidos; arquivos com o mesmo conteúdo (sha256) de outro já registrado e
+# cópias de backup (eh_backup) são ignorados. Os meses já armazenados não
+# são tocados. Arquivos que falharam ficam registrados como "erro" (com a
+# mensagem) e só são lidos de novo quando mudam.
+class ArmazemHistorico:
+    VERSAO = 4
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._trava = threading.Lock()
+        self._colunas = {n: n.replace(" ", "_") for n in NUMERIC_COLS}
+        with self._trava:
+            self._criar()
+
+    def _conectar(self):
+        os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+        return sqlite3.connect(self.caminho, timeout=30)
+
+    def _criar(self):
+        valores = ", ".join(f"{c} REAL NOT NULL DEFAULT 0" for c in self._colunas.values())
+        dims = ", ".join(f"{d} TEXT" for d in DIMENSOES)
+        with closing(self._conectar()) as con, con:
+            con.execute("CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT)")
+            versao = con.execute("SELECT valor FROM meta WHERE chave = 'versao'").fetchone()
+            if versao is None or int(versao[0]) != self.VERSAO:
+                con.execute("DROP TABLE IF EXISTS arquivos")
+                con.execute("DROP TABLE IF EXISTS agregados")
+                con.execute("INSERT OR REPLACE INTO meta VALUES ('versao', ?)", (str(self.VERSAO),))
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS arquivos ("
+                "caminho TEXT PRIMARY KEY, tamanho INTEGER, mtime_ns INTEGER, "
+                "sha256 TEXT, mes TEXT, situacao TEXT, erro TEXT)"
+            )
+            con.execute(f"CREATE TABLE IF NOT EXISTS agregados (mes TEXT NOT NULL, origem TEXT NOT NULL, {dims}, {valores})")
+            con.execute("CREATE INDEX IF NOT EXISTS agregados_mes ON agregados (mes)")
+
+    # Arquivos novos/alterados são lidos e agregados em paralelo (hash em
+    # threads, parse em processos); a gravação no SQLite continua na ordem
+    # dos arquivos, então duplicados e meses repetidos têm o mesmo resultado
+    # da leitura sequencial. Devolve os erros de todos os arquivos da pasta,
+    # inclusive os registrados em sincronizações anteriores.
+    def sincronizar(self, pasta, workers=None):
+        workers = workers or WORKERS_HISTORICO
+        arquivos = listar_arquivos(pasta)
+        erros = []
+        with self._trava, closing(self._conectar()) as con:
+            # arquivos removidos da pasta levam junto os seus agregados; as
+            # cópias que eram duplicadas deles voltam a ser lidas
+            registrados = con.execute("SELECT caminho, sha256, mes FROM arquivos").fetchall()
+            for caminho, sha, mes in registrados:
+                if caminho in arquivos:
+                    continue
+                with con:
+                    con.execute("DELETE FROM agregados WHERE origem = ?", (caminho,))
+                    con.execute("DELETE FROM arquivos WHERE caminho = ? OR (sha256 = ? AND situacao = 'duplicado')", (caminho, sha))
+                    # os arquivos que ele tinha substituído no mesmo mês também
+                    con.execute("DELETE FROM arquivos WHERE mes = ? AND situacao = 'substituido'", (mes,))
+
+            conhecidos = {
+                caminho: (tamanho, mtime_ns)
+                for caminho, tamanho, mtime_ns in con.execute("SELECT caminho, tamanho, mtime_ns FROM arquivos")
+            }
+            pendentes = {}
+            for arq in arquivos:
+                info = os.stat(arq)
+                if conhecidos.get(arq) == (info.st_size, info.st_mtime_ns):
+                    continue
+                if eh_backup(arq):
+                    self._registrar_situacao(con, arq, info, None, "backup")
+                else:
+                    pendentes[arq] = info
+            if not pendentes:
+                return self._erros(con)
+
+            hashes = _em_paralelo(_sha256, list(pendentes), workers, processos=False)
+            ok = {
+                sha: caminho
+                for caminho, sha in con.execute("SELECT caminho, sha256 FROM arquivos WHERE situacao = 'ok'")
+                if caminho not in pendentes
+            }
+            # decide os duplicados antes de ler: cópias não chegam a ser lidas
+            duplicados = {}
+            for arq in pendentes:
+                sha, erro = hashes[arq]
+                if erro is None:
+                    if sha in ok:
+                        duplicados[arq] = ok[sha]
+                    else:
+                        ok[sha] = arq
+
+            a_ler = [arq for arq in pendentes if hashes[arq][1] is None and arq not in duplicados]
+            if sum(pendentes[arq].st_size for arq in a_ler) < PARALELO_MIN_MB * 2**20:
+                workers = 1
+            lidos = _em_paralelo(ler_mes, a_ler, workers, processos=True)
+
+            for arq, info in pendentes.items():
+                sha, erro = hashes[arq]
+                if erro is None and arq not in duplicados:
+                    resultado, erro = lidos[arq]
+                try:
+                    if erro is not None:
+                        self._registrar_situacao(con, arq, info, sha, "erro", erro)
+                    elif arq in duplicados:
+                        self._registrar_situacao(con, arq, info, sha, "duplicado")
+                    else:
+                        self._registrar(con, arq, info, sha, *resultado)
+                except Exception as e:
+                    erros.append((arq, e))
+            return self._erros(con) + erros
+
+    # erros registrados dos arquivos ainda presentes (novos ou não)
+    @staticmethod
+    def _erros(con):
+        return con.execute("SELECT caminho, erro FROM arquivos WHERE situacao = 'erro' ORDER BY caminho").fetchall()
+
+    # arquivo que não entra na tabela (duplicado, backup ou erro)
+    def _registrar_situacao(self, con, arq, info, sha, situacao, erro=None):
+        with con:
+            con.execute("DELETE FROM agregados WHERE origem = ?", (arq,))
+            con.execute(
+                "INSERT OR REPLACE INTO arquivos VALUES (?, ?, ?, ?, NULL, ?, ?)",
+                (arq, info.st_size, info.st_mtime_ns, sha, situacao, None if erro is None else str(erro)),
+            )
+
+    def _registrar(self, con, arq, info, sha, mes, agregado):
+        chave_mes = mes.strftime("%Y-%m-%d")
+        with con:
+            # mais de um arquivo para o mesmo mês: vale o último registrado; o
+            # substituído volta a ser lido se este sair da pasta
+            con.execute(
+                "UPDATE arquivos SET situacao = 'substituido' WHERE mes = ? AND caminho != ? AND situacao = 'ok'",
+                (chave_mes, arq),
+            )
+            con.execute("DELETE FROM agregados WHERE mes = ? OR origem = ?", (chave_mes, arq))
+            if agregado is not None:
+                linhas = agregado.drop(columns="mes").rename(columns=self._colunas)
+                linhas = linhas.astype({d: object for d in DIMENSOES}).where(linhas.notna(), None)
+                colunas = ["mes", "origem", *linhas.columns]
+                con.executemany(
+                    f"INSERT INTO agregados ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})",
+                    [(chave_mes, arq, *linha) for linha in linhas.itertuples(index=False)],
+                )
+            con.execute(
+                "INSERT OR REPLACE INTO arquivos VALUES (?, ?, ?, ?, ?, 'ok', NULL)",
+                (arq, info.st_size, info.st_mtime_ns, sha, chave_mes),
+            )
+
+    def tabela(self):
+        with closing(self._conectar()) as con:
+            tabela = pd.read_sql_query(
+                f"SELECT mes, {', '.join(DIMENSOES)}, {', '.join(self._colunas.values())} "
+                "FROM agregados ORDER BY mes, rowid",
+                con,
+            )
+        tabela["mes"] = pd.to_datetime(tabela["mes"])
+        return tabela.rename(columns={v: k for k, v in self._colunas.items()})
+
+
+_armazens = {}
+
+def obter_armazem(pasta):
+    caminho = os.path.join(os.path.abspath(pasta), PASTA_ARMAZEM, "historico.sqlite")
+    with _trava:
+        if caminho not in _armazens:
+            _armazens[caminho] = ArmazemHistorico(caminho)
+        return _armazens[caminho]
+
+# Tabela longa do histórico da pasta, sincronizando antes o armazém com os
+# arquivos novos/alterados. Enquanto nenhum arquivo mudar, devolve a mesma
+# tabela (compartilhada: não alterar no lugar).
+def ler_historico(pasta, workers=None, aceitar_antigo=None):
+    arquivos = listar_arquivos(pasta)
+    chave = tuple((arq, CacheDataFrames.assinatura(arq)) for arq in arquivos)
+    pasta = os.path.abspath(pasta)
+    if aceitar_antigo is None:
+        aceitar_antigo = cache.renovacao_externa
+
+    with _trava:
+        memo = _memo.get(pasta)
+        # com o vigia ligado, a versão anterior vale até ele terminar a nova
+        if memo and (memo["chave"] == chave or aceitar_antigo):
+            return memo["tabela"], list(memo["erros"])
+
+    def sincronizar():
+        armazem = obter_armazem(pasta)
+        erros = armazem.sincronizar(pasta, workers)
+        return armazem.tabela(), {"erros": [(arq, str(e)) for arq, e in erros]}
+
+    # com DASHBOARD_COMPARTILHADO, só o primeiro processo sincroniza cada
+    # versão; os outros mapeiam a tabela publicada
+    if compartilhado.ativo():
+        tabela, metadados = compartilhado.obter(pasta, (ArmazemHistorico.VERSAO, chave), sincronizar)
+    else:
+        tabela, metadados = sincronizar()
+    erros = [tuple(erro) for erro in metadados["erros"]]
+
+    with _trava:
+        _memo[pasta] = {"chave": chave, "tabela": tabela, "erros": erros}
+    return tabela, list(erros)
+
+
+_memo = {}
+_trava = threading.Lock()
+
+# esquece a tabela memorizada da pasta (o armazém em disco continua)
+def descartar(pasta):
+    with _trava:
+        _memo.pop(os.path.abspath(pasta), None)
+
+# -------------------------
+# AGREGAÇÕES DERIVADAS
+# -------------------------
+def serie_mensal(tabela, metrica="pago ate o mes", por=None, filtro=None):
+    dados = tabela
+    if filtro:
+        for dim, valor in filtro.items():
+            dados = dados[dados[dim] == valor]
+    chaves = ["mes"] + ([por] if por else [])
+    return dados.groupby(chaves, as_index=False, observed=True)[metrica].sum()
+
+# série no formato do Prophet (ds, y) para um recorte da tabela longa
+def serie_previsao(tabela, metrica="pago ate o mes", filtro=None):
+    serie = serie_mensal(tabela, metrica, filtro=filtro)
+    return serie[["mes", metrica]].rename(columns={"mes": "ds", metrica: "y"})
+
+# uma série (ds, y) por valor da dimensão, na mesma forma de serie_previsao
+def series_por_dimensao(tabela, dim, metrica="pago ate o mes"):
+    agrupado = serie_mensal(tabela, metrica, por=dim)
+    for valor, grupo in agrupado.groupby(dim, observed=True):
+        serie = grupo[["mes", metrica]].rename(columns={"mes": "ds", metrica: "y"})
+        yield valor, serie.reset_index(drop=True)
+
+# matriz séries x meses (NaN onde a série não tem o mês) para previsão e
+# avaliação em lote; devolve (meses, chaves das séries, matriz)
+def matriz_series(tabela, dims, metrica="pago ate o mes"):
+    pivo = tabela.pivot_table(index=list(dims), columns="mes", values=metrica, aggfunc="sum", observed=True)
+    return pd.DatetimeIndex(pivo.columns), pivo.index, pivo.to_numpy(dtype=float)
@@ -0,0 +1,228 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import pyarrow.feather as feather
+
+from carregamento import NUMERIC_COLS, PASTA_COLUNAR, CacheDataFrames, carregar, mapear_colunas
+from consultas import ConsultasPandas
+from cubo import Cubo
+from historico import ler_historico, listar_arquivos
+from streaming import arquivo_grande, obter_agregados
+
+# -------------------------
+# CONFIG
+# -------------------------
+# pacotes pré-calculados ficam em <pasta do relatório>/.cache/pacote
+# (uma subpasta por versão + ATUAL)
+PASTA_PACOTE = os.path.join(PASTA_COLUNAR, "pacote")
+# versões antigas mantidas ao lado da atual
+MANTER_VERSOES = int(os.environ.get("DASHBOARD_PACOTE_VERSOES", "3"))
+# formato do pacote; pacotes de outro formato são ignorados pelo app
+VERSAO_PACOTE = 4
+ARQUIVO_ATUAL = "ATUAL"
+
+DIMENSOES_CUBO = ["funcao descricao", "subfuncao descricao", "descricao categoria economica"]
+
+logger = logging.getLogger(__name__)
+
+# -------------------------
+# FUNÇÕES AUXILIARES
+# -------------------------
+def pasta_pacote(arquivo):
+    return os.path.join(os.path.dirname(os.path.abspath(arquivo)), PASTA_PACOTE)
+
+def _origens(arquivo, pasta_historico):
+    arquivos = [arquivo] + listar_arquivos(pasta_historico)
+    return {os.path.abspath(arq): list(CacheDataFrames.assinatura(arq)) for arq in arquivos}
+
+def _salvar_json(dados, caminho):
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(dados, f, ensure_ascii=False, indent=2, default=str)
+
+def _ler_json(caminho):
+    with open(caminho, encoding="utf-8") as f:
+        return json.load(f)
+
+# -------------------------
+# GERAÇÃO (LINHA DE COMANDO)
+# -------------------------
+# Faz fora do app tudo o que a tela calcula: cubo de agregados (cards,
+# ranking e gráficos saem dele), totais/execução/top 3 sem filtro,
+# tabela longa do histórico e previsões (total + cada função). Grava em
+# uma pasta nova e só então aponta ATUAL para ela: o app nunca lê um
+# pacote pela metade.
+def gerar_pacote(arquivo, pasta_historico, destino=None, dimensoes=("funcao",), periodos=2, workers=None):
+    from previsao import PREVISOR, prever_catalogo
+
+    destino = destino or pasta_pacote(arquivo)
+    inicio = time.perf_counter()
+    origens = _origens(arquivo, pasta_historico)
+    erros = []
+
+    if arquivo_grande(arquivo):
+        # só os agregados, lidos em blocos (streaming.py)
+        agregados = obter_agregados(arquivo)
+        expected = agregados.expected
+        consultas = agregados.consultas
+    else:
+        df = carregar(arquivo)
+        expected = mapear_colunas(df.columns)
+        dims = [expected.get(n) for n in DIMENSOES_CUBO]
+        medidas = [expected.get(n) for n in NUMERIC_COLS]
+        consultas = ConsultasPandas(df, dims, medidas, expected.get("funcao descricao"))
+
+    totais = consultas.totais()
+    orcado = totais.get(expected.get("orcado atualizado"), 0.0)
+    pago = totais.get(expected.get("pago ate o mes"), 0.0)
+    agregados = {
+        "totais": totais,
+        "execucao_%": (pago / orcado) * 100 if orcado and orcado > 0 else None,
+    }
+    if consultas.col_funcao in consultas.dimensoes and expected.get("pago ate o mes") in consultas.medidas:
+        top3 = consultas.top_n(consultas.col_funcao, expected.get("pago ate o mes"), 3)
+        agregados["top3"] = top3.astype({consultas.col_funcao: str}).to_dict("records")
+
+    historico, erros_historico = ler_historico(pasta_historico)
+    erros.extend(("historico", arq, str(e)) for arq, e in erros_historico)
+    catalogo, erros_previsao = prever_catalogo(historico, dimensoes, periodos=periodos, workers=workers)
+    erros.extend(("previsao", chave, str(e)) for chave, e in erros_previsao)
+
+    # nome único por geração (microssegundos + processo): duas gerações no
+    # mesmo segundo não disputam a mesma pasta
+    versao = f"{datetime.now():%Y%m%dT%H%M%S%f}-{os.getpid()}"
+    os.makedirs(destino, exist_ok=True)
+    temporaria = os.path.join(destino, f".{versao}.tmp")
+    os.makedirs(temporaria)
+
+    feather.write_feather(consultas.cubo.celulas, os.path.join(temporaria, "cubo.arrow"))
+    feather.write_feather(historico, os.path.join(temporaria, "historico.arrow"))
+    feather.write_feather(catalogo, os.path.join(temporaria, "previsoes.arrow"))
+    _salvar_json(agregados, os.path.join(temporaria, "agregados.json"))
+    _salvar_json({
+        "versao_pacote": VERSAO_PACOTE,
+        "versao": versao,
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "duracao_s": round(time.perf_counter() - inicio, 2),
+        "relatorio": os.path.abspath(arquivo),
+        "historico": os.path.abspath(pasta_historico),
+        "origens": origens,
+        "colunas": expected,
+        "dimensoes": consultas.dimensoes,
+        "medidas": consultas.medidas,
+        "col_funcao": consultas.col_funcao,
+        "previsor": PREVISOR,
+        "periodos": periodos,
+        "series_previstas": int(catalogo.groupby(["dimensao", "valor"]).ngroups) if len(catalogo) else 0,
+        "erros": erros,
+    }, os.path.join(temporaria, "manifesto.json"))
+
+    pasta_versao = os.path.join(destino, versao)
+    os.rename(temporaria, pasta_versao)
+
+    atual = os.path.join(destino, ARQUIVO_ATUAL)
+    with open(f"{atual}.tmp", "w", encoding="utf-8") as f:
+        f.write(versao)
+    os.replace(f"{atual}.tmp", atual)
+
+    _limpar_versoes(destino, versao)
+    return pasta_versao, erros
+
+# apaga as versões mais antigas; a gerada agora e a apontada por ATUAL
+# (outra geração pode tê-lo trocado no meio) nunca saem: o app pode estar
+# com os arquivos delas mapeados
+def _limpar_versoes(destino, atual):
+    try:
+        with open(os.path.join(destino, ARQUIVO_ATUAL), encoding="utf-8") as f:
+            apontada = f.read().strip()
+    except OSError:
+        apontada = atual
+    versoes = sorted(
+        nome for nome in os.listdir(destino)
+        if os.path.isdir(os.path.join(destino, nome)) and not nome.startswith(".")
+    )
+    antigas = [v for v in versoes if v not in (atual, apontada)]
+    for nome in antigas[:max(len(antigas) - MANTER_VERSOES, 0)]:
+        shutil.rmtree(os.path.join(destino, nome), ignore_errors=True)
+
+# -------------------------
+# LEITURA (APP, SOMENTE LEITURA)
+# -------------------------
+class Pacote:
+    def __init__(self, pasta):
+        self.pasta = pasta
+        self.manifesto = _ler_json(os.path.join(pasta, "manifesto.json"))
+        self.agregados = _ler_json(os.path.join(pasta, "agregados.json"))
+        self.cubo = Cubo(
+            feather.read_feather(os.path.join(pasta, "cubo.arrow"), memory_map=True),
+            self.manifesto["dimensoes"],
+            self.manifesto["medidas"],
+        )
+        self.historico = feather.read_feather(os.path.join(pasta, "historico.arrow"), memory_map=True)
+        previsoes = feather.read_feather(os.path.join(pasta, "previsoes.arrow"), memory_map=True)
+        self._previsoes = {chave: grupo.reset_index(drop=True) for chave, grupo in previsoes.groupby(["dimensao", "valor"])}
+
+    @property
+    def versao(self):
+        return self.manifesto["versao"]
+
+    # o pacote só vale enquanto os arquivos de origem forem os mesmos
+    def confere(self, arquivo, pasta_historico):
+        try:
+            return _origens(arquivo, pasta_historico) == self.manifesto["origens"]
+        except OSError:
+            return False
+
+    def consultas(self):
+        return ConsultasPandas(None, self.cubo.dimensoes, self.cubo.medidas, self.manifesto["col_funcao"], cubo=self.cubo)
+
+    # previsão (mes, yhat, yhat_lower, yhat_upper) de "total" ou de um valor
+    # de dimensão; None se a série não estiver no pacote ou se o pacote foi
+    # gerado com outro horizonte ou outro previsor (DASHBOARD_PREVISOR)
+    def previsao(self, dimensao, valor="Total", periodos=2):
+        from previsao import PREVISOR
+
+        if periodos != self.manifesto["periodos"] or self.manifesto.get("previsor") != PREVISOR:
+            return None
+        return self._previsoes.get((dimensao, valor))
+
+
+_pacotes = {}  # destino -> (pasta da versão, pacote)
+_trava = threading.Lock()
+
+# Pacote apontado por ATUAL (carregado uma vez por versão e compartilhado
+# entre sessões); None se não houver pacote válido.
+def abrir_pacote(destino):
+    destino = os.path.abspath(destino)
+    try:
+        with open(os.path.join(destino, ARQUIVO_ATUAL), encoding="utf-8") as f:
+            versao = f.read().strip()
+    except OSError:
+        return None
+
+    pasta = os.path.abspath(os.path.join(destino, versao))
+    with _trava:
+        item = _pacotes.get(destino)
+        if item is not None and item[0] == pasta:
+            return item[1]
+
+    try:
+        pacote = Pacote(pasta)
+        if pacote.manifesto.get("versao_pacote") != VERSAO_PACOTE:
+            logger.warning("Pacote %s em formato antigo; ignorado", pasta)
+            pacote = None
+    except (OSError, KeyError, ValueError):
+        logger.exception("Pacote %s ilegível; ignorado", pasta)
+        pacote = None
+
+    with _trava:
+        _pacotes[destino] = (pasta, pacote)
+    return pacote
+
+def descartar(destino):
+    with _trava:
+        _pacotes.pop(os.path.abspath(destino), None)
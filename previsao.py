@@ -0,0 +1,247 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from pyarrow import feather
+
+from desempenho import medir
+from historico import serie_previsao, series_por_dimensao
+from previsores import frame_previsao, obter_previsor
+
+# -------------------------
+# CONFIG
+# -------------------------
+PASTA_PREVISOES = os.environ.get("DASHBOARD_PASTA_PREVISOES", os.path.join("dados", ".cache", "previsoes"))
+PREVISOES_MEMORIA = int(os.environ.get("DASHBOARD_PREVISOES_MEMORIA", "256"))
+PREVISOES_DISCO = int(os.environ.get("DASHBOARD_PREVISOES_DISCO", "2048"))
+
+# catálogo com as previsões de todas as funções (gerado em lote)
+ARQUIVO_CATALOGO = os.environ.get("DASHBOARD_CATALOGO_PREVISOES", os.path.join("dados", ".cache", "catalogo_previsoes.arrow"))
+# previsor padrão da instalação: "prophet" ou "numpy" (ver previsores.py)
+PREVISOR = os.environ.get("DASHBOARD_PREVISOR", "prophet")
+WORKERS_PREVISAO = int(os.environ.get("DASHBOARD_WORKERS_PREVISAO", "0")) or os.cpu_count()
+# muda quando o formato das previsões muda (invalida as guardadas em disco)
+VERSAO_PREVISAO = 2
+
+logger = logging.getLogger(__name__)
+
+# -------------------------
+# CHAVE
+# -------------------------
+# serie: DataFrame com colunas ds (mês) e y (valor)
+def chave_previsao(serie, periodos, parametros):
+    h = hashlib.sha256()
+    h.update(pd.util.hash_pandas_object(serie[["ds", "y"]], index=False).values.tobytes())
+    h.update(json.dumps({"periodos": periodos, "versao": VERSAO_PREVISAO, **parametros}, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+# -------------------------
+# CACHE (MEMÓRIA + DISCO, LRU)
+# -------------------------
+# Guarda o DataFrame da previsão (não o modelo): é o que a tela usa e é
+# bem menor que o modelo ajustado. As previsões devolvidas são
+# compartilhadas entre sessões e não devem ser alteradas no lugar.
+class CachePrevisoes:
+    def __init__(self, pasta, max_memoria, max_disco):
+        self.pasta = pasta
+        self.max_memoria = max_memoria
+        self.max_disco = max_disco
+        self._memoria = OrderedDict()
+        self._trava = threading.Lock()
+
+    def _arquivo(self, chave):
+        return os.path.join(self.pasta, f"{chave}.arrow")
+
+    def obter(self, chave):
+        with self._trava:
+            if chave in self._memoria:
+                self._memoria.move_to_end(chave)
+                return self._memoria[chave]
+
+        arquivo = self._arquivo(chave)
+        try:
+            previsao = feather.read_feather(arquivo)
+            os.utime(arquivo)  # marca como usado (LRU do disco)
+        except (OSError, ValueError):
+            return None
+        self._guardar_memoria(chave, previsao)
+        return previsao
+
+    def guardar(self, chave, previsao):
+        self._guardar_memoria(chave, previsao)
+        try:
+            os.makedirs(self.pasta, exist_ok=True)
+            temporario = f"{self._arquivo(chave)}.{os.getpid()}.tmp"
+            feather.write_feather(previsao, temporario)
+            os.replace(temporario, self._arquivo(chave))
+            self._limpar_disco()
+        except OSError:
+            pass
+
+    def _guardar_memoria(self, chave, previsao):
+        with self._trava:
+            self._memoria[chave] = previsao
+            self._memoria.move_to_end(chave)
+            while len(self._memoria) > self.max_memoria:
+                self._memoria.popitem(last=False)
+
+    def _limpar_disco(self):
+        arquivos = [
+            os.path.join(self.pasta, nome)
+            for nome in os.listdir(self.pasta) if nome.endswith(".arrow")
+        ]
+        if len(arquivos) <= self.max_disco:
+            return
+        arquivos.sort(key=os.path.getmtime)
+        for arquivo in arquivos[:len(arquivos) - self.max_disco]:
+            try:
+                os.remove(arquivo)
+            except OSError:
+                pass
+
+
+cache = CachePrevisoes(PASTA_PREVISOES, PREVISOES_MEMORIA, PREVISOES_DISCO)
+
+def prever(serie, periodos=2, previsor=None, **parametros):
+    previsor = previsor or PREVISOR
+    chave = chave_previsao(serie, periodos, {"previsor": previsor, **parametros})
+    previsao = cache.obter(chave)
+    if previsao is None:
+        with medir(f"ajuste {previsor}", len(serie)):
+            previsao = obter_previsor(previsor, **parametros).prever(serie, periodos)
+        cache.guardar(chave, previsao)
+    return previsao
+
+# -------------------------
+# PREVISÃO EM LOTE (CATÁLOGO)
+# -------------------------
+def _ajustar_item(item):
+    chave, nome, serie, periodos, parametros = item
+    return chave, obter_previsor(nome, **parametros).prever(serie, periodos)
+
+# Ajusta a série total e uma previsão por valor de cada dimensão (ex.: toda
+# função). Previsores vetorizados ajustam tudo em uma chamada; os demais
+# (Prophet) rodam em processos paralelos. Cada resultado vai para o cache
+# de previsões, que é onde a tela consulta; o catálogo devolvido reúne
+# tudo em uma tabela.
+def prever_catalogo(tabela, dimensoes=("funcao",), periodos=2, workers=None, minimo=3, previsor=None, **parametros):
+    previsor = previsor or PREVISOR
+    chave_parametros = {"previsor": previsor, **parametros}
+
+    itens = [("total", "Total", chave_previsao(serie, periodos, chave_parametros), serie)
+             for serie in [serie_previsao(tabela)] if len(serie) >= minimo]
+    for dim in dimensoes:
+        for valor, serie in series_por_dimensao(tabela, dim):
+            if len(serie) >= minimo:
+                itens.append((dim, valor, chave_previsao(serie, periodos, chave_parametros), serie))
+
+    resultados = {}
+    pendentes = {}
+    for _, _, chave, serie in itens:
+        previsao = cache.obter(chave)
+        if previsao is None:
+            pendentes[chave] = serie
+        else:
+            resultados[chave] = previsao
+
+    erros = []
+    modelo = obter_previsor(previsor, **parametros)
+    if pendentes and modelo.em_lote:
+        # agrupa as séries pelos meses que têm: cada grupo é uma matriz
+        grupos = {}
+        for chave, serie in pendentes.items():
+            grupos.setdefault(tuple(serie["ds"]), []).append(chave)
+        for meses, chaves in grupos.items():
+            Y = [pendentes[chave]["y"].to_numpy(dtype=float) for chave in chaves]
+            yhat, desvio = modelo.prever_lote(pd.DatetimeIndex(meses), Y, periodos)
+            for i, chave in enumerate(chaves):
+                previsao = frame_previsao(meses, yhat[i], desvio[i], periodos)
+                cache.guardar(chave, previsao)
+                resultados[chave] = previsao
+    elif pendentes:
+        # "spawn": não herda as threads do servidor do Streamlit
+        contexto = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers or WORKERS_PREVISAO, mp_context=contexto) as pool:
+            futuros = {
+                pool.submit(_ajustar_item, (chave, previsor, serie, periodos, parametros)): chave
+                for chave, serie in pendentes.items()
+            }
+            for futuro in as_completed(futuros):
+                try:
+                    chave, previsao = futuro.result()
+                except Exception as e:
+                    erros.append((futuros[futuro], e))
+                    continue
+                cache.guardar(chave, previsao)
+                resultados[chave] = previsao
+
+    partes = []
+    for dim, valor, chave, _ in itens:
+        if chave not in resultados:
+            continue
+        parte = resultados[chave][["mes", "yhat", "yhat_lower", "yhat_upper"]].copy()
+        parte.insert(0, "chave", chave)
+        parte.insert(0, "valor", valor)
+        parte.insert(0, "dimensao", dim)
+        partes.append(parte)
+
+    colunas = ["dimensao", "valor", "chave", "mes", "yhat", "yhat_lower", "yhat_upper"]
+    catalogo = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=colunas)
+    return catalogo, erros
+
+def salvar_catalogo(catalogo, caminho=ARQUIVO_CATALOGO):
+    os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    feather.write_feather(catalogo, temporario)
+    os.replace(temporario, caminho)
+    return caminho
+
+_agendados = set()
+_trava_agenda = threading.Lock()
+
+def _rodar_catalogo(tabela, dimensoes, destino, parametros):
+    try:
+        catalogo, erros = prever_catalogo(tabela, dimensoes, **parametros)
+        for chave, e in erros:
+            logger.warning("Falha ao prever a série %s: %s", chave, e)
+        salvar_catalogo(catalogo, destino)
+    except Exception:
+        logger.exception("Falha ao gerar o catálogo de previsões")
+
+def _marcar_agendado(tabela):
+    impressao = hashlib.sha256(
+        pd.util.hash_pandas_object(tabela, index=False).values.tobytes()
+    ).hexdigest()
+    with _trava_agenda:
+        if impressao in _agendados:
+            return False
+        _agendados.add(impressao)
+    return True
+
+# Dispara o catálogo em segundo plano uma única vez por versão da tabela;
+# devolve False se essa versão já foi agendada.
+def agendar_catalogo(tabela, dimensoes=("funcao",), destino=ARQUIVO_CATALOGO, **parametros):
+    if not _marcar_agendado(tabela):
+        return False
+
+    threading.Thread(
+        target=_rodar_catalogo,
+        args=(tabela, tuple(dimensoes), destino, parametros),
+        name="catalogo-previsoes",
+        daemon=True,
+    ).start()
+    return True
+
+# o mesmo, na thread de quem chama (vigia de arquivos): ao terminar, as
+# previsões já estão no cache e o agendamento do app não se repete
+def gerar_catalogo(tabela, dimensoes=("funcao",), destino=ARQUIVO_CATALOGO, **parametros):
+    if not _marcar_agendado(tabela):
+        return False
+    _rodar_catalogo(tabela, tuple(dimensoes), destino, parametros)
+    return True
@@ -0,0 +1,208 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+# -------------------------
+# CONFIG
+# -------------------------
+# z do intervalo de 80% (mesma largura padrão do Prophet)
+INTERVALO_Z = 1.2816
+MESES_ANO = 12
+
+# -------------------------
+# FUNÇÕES AUXILIARES
+# -------------------------
+def meses_futuros(datas, periodos):
+    inicio = pd.Timestamp(datas[-1]) + pd.offsets.MonthBegin(1)
+    return pd.date_range(inicio, periods=periodos, freq="MS")
+
+# Monta o DataFrame no formato que a tela usa (ds, mes, yhat, yhat_lower,
+# yhat_upper) a partir de uma linha do lote
+def frame_previsao(datas, yhat, desvio, periodos):
+    datas = pd.DatetimeIndex(datas)
+    todas = datas.append(meses_futuros(datas, periodos)) if periodos else datas
+    passos = np.r_[np.ones(len(datas)), np.sqrt(np.arange(1, periodos + 1))]
+    margem = INTERVALO_Z * desvio * passos
+    return pd.DataFrame({
+        "ds": todas,
+        "mes": todas.to_period("M").to_timestamp(),
+        "yhat": yhat,
+        "yhat_lower": yhat - margem,
+        "yhat_upper": yhat + margem,
+    })
+
+# -------------------------
+# INTERFACE
+# -------------------------
+# Um previsor recebe várias séries mensais alinhadas nas mesmas datas
+# (matriz n_series x n_meses, NaN onde faltar valor) e devolve o ajuste
+# + os meses futuros (n_series x (n_meses + periodos)) e o desvio dos
+# resíduos de cada série.
+class Previsor:
+    nome = ""
+    # True quando prever_lote ajusta todas as séries de uma vez
+    em_lote = False
+
+    def prever_lote(self, datas, Y, periodos):
+        raise NotImplementedError
+
+    def prever(self, serie, periodos=2):
+        datas = pd.DatetimeIndex(serie["ds"])
+        yhat, desvio = self.prever_lote(datas, serie["y"].to_numpy(float)[None, :], periodos)
+        return frame_previsao(datas, yhat[0], desvio[0], periodos)
+
+# -------------------------
+# NUMPY: TENDÊNCIA + HOLT AMORTECIDO (+ SAZONALIDADE)
+# -------------------------
+# Todas as séries do lote são ajustadas juntas: o laço é só sobre os meses
+# (poucos), as operações são vetorizadas sobre as séries.
+class PrevisorNumpy(Previsor):
+    nome = "numpy"
+    em_lote = True
+
+    def __init__(self, alfa=0.5, beta=0.3, amortecimento=0.98):
+        self.alfa = alfa
+        self.beta = beta
+        self.amortecimento = amortecimento
+
+    @staticmethod
+    def _tendencia_linear(Y):
+        t = np.arange(Y.shape[1], dtype=float)
+        peso = (~np.isnan(Y)).astype(float)
+        n = np.maximum(peso.sum(axis=1), 1.0)
+        t_medio = (peso * t).sum(axis=1) / n
+        y_medio = np.nansum(Y, axis=1) / n
+        dt = (t - t_medio[:, None]) * peso
+        var = (dt * dt).sum(axis=1)
+        inclinacao = np.divide(
+            (dt * (np.nan_to_num(Y) - y_medio[:, None])).sum(axis=1), var,
+            out=np.zeros_like(var), where=var > 0,
+        )
+        return y_medio - inclinacao * t_medio, inclinacao
+
+    def _sazonalidade(self, Y, intercepto, inclinacao):
+        # índice sazonal aditivo: só com pelo menos dois anos completos
+        n, T = Y.shape
+        if T < 2 * MESES_ANO:
+            return None
+        t = np.arange(T)
+        residuo = Y - (intercepto[:, None] + inclinacao[:, None] * t)
+        indices = np.zeros((n, MESES_ANO))
+        for m in range(MESES_ANO):
+            coluna = residuo[:, m::MESES_ANO]
+            validos = ~np.isnan(coluna)
+            indices[:, m] = np.where(validos.any(axis=1), np.nansum(coluna, axis=1) / np.maximum(validos.sum(axis=1), 1), 0.0)
+        return indices - indices.mean(axis=1, keepdims=True)
+
+    def prever_lote(self, datas, Y, periodos):
+        Y = np.asarray(Y, dtype=float)
+        n, T = Y.shape
+        phi, alfa, beta = self.amortecimento, self.alfa, self.beta
+
+        intercepto, inclinacao = self._tendencia_linear(Y)
+        indices = self._sazonalidade(Y, intercepto, inclinacao)
+        posicoes = np.arange(T + periodos) % MESES_ANO
+        sazonal = indices[:, posicoes] if indices is not None else np.zeros((n, T + periodos))
+        Z = Y - sazonal[:, :T]
+
+        # nível/tendência iniciais vêm da reta ajustada (um passo antes do início)
+        nivel = intercepto - inclinacao
+        tendencia = inclinacao
+        ajustado = np.empty((n, T + periodos))
+        for i in range(T):
+            previsto = nivel + phi * tendencia
+            ajustado[:, i] = previsto
+            z = Z[:, i]
+            ok = ~np.isnan(z)
+            novo_nivel = np.where(ok, alfa * np.nan_to_num(z) + (1 - alfa) * previsto, previsto)
+            tendencia = np.where(ok, beta * (novo_nivel - nivel) + (1 - beta) * phi * tendencia, phi * tendencia)
+            nivel = novo_nivel
+
+        acumulado = np.cumsum(phi ** np.arange(1, periodos + 1))
+        ajustado[:, T:] = nivel[:, None] + acumulado[None, :] * tendencia[:, None]
+        ajustado += sazonal
+
+        residuo = Y - ajustado[:, :T]
+        desvio = np.sqrt(np.nanmean(residuo ** 2, axis=1))
+        return ajustado, np.nan_to_num(desvio)
+
+# -------------------------
+# PROPHET (OPCIONAL)
+# -------------------------
+class PrevisorProphet(Previsor):
+    nome = "prophet"
+
+    def __init__(self, **parametros):
+        self.parametros = parametros
+
+    def _ajustar(self, serie):
+        # importa só quando usado: o Prophet é a dependência mais pesada do app
+        from prophet import Prophet
+
+        modelo = Prophet(**self.parametros)
+        modelo.fit(serie)
+        return modelo
+
+    # meses futuros (início do mês) iguais aos de prever_lote e do NumPy;
+    # os intervalos são os do próprio Prophet
+    def prever(self, serie, periodos=2):
+        modelo = self._ajustar(serie)
+        datas = pd.DatetimeIndex(serie["ds"])
+        previsao = modelo.predict(pd.DataFrame({"ds": datas.append(meses_futuros(datas, periodos))}))
+        previsao["mes"] = previsao["ds"].dt.to_period("M").dt.to_timestamp()
+        return previsao
+
+    # uma série por vez (o Prophet não ajusta em lote), prevendo exatamente
+    # os mesmos meses que os outros previsores
+    def prever_lote(self, datas, Y, periodos):
+        datas = pd.DatetimeIndex(datas)
+        meses = datas.append(meses_futuros(datas, periodos))
+        yhat = np.full((len(Y), len(meses)), np.nan)
+        desvio = np.zeros(len(Y))
+        for i, linha in enumerate(np.asarray(Y, dtype=float)):
+            ok = ~np.isnan(linha)
+            if ok.sum() < 2:
+                continue
+            modelo = self._ajustar(pd.DataFrame({"ds": datas[ok], "y": linha[ok]}))
+            yhat[i] = modelo.predict(pd.DataFrame({"ds": meses}))["yhat"].to_numpy()
+            desvio[i] = np.sqrt(np.nanmean((linha - yhat[i, :len(datas)]) ** 2))
+        return yhat, desvio
+
+
+PREVISORES = {
+    PrevisorNumpy.nome: PrevisorNumpy,
+    PrevisorProphet.nome: PrevisorProphet,
+}
+
+def obter_previsor(nome, **parametros):
+    if nome not in PREVISORES:
+        raise ValueError(f"Previsor desconhecido: {nome} (opções: {', '.join(PREVISORES)})")
+    return PREVISORES[nome](**parametros)
+
+# -------------------------
+# AVALIAÇÃO (TEMPO DE AJUSTE + BACKTEST)
+# -------------------------
+# Separa os últimos `horizonte` meses, ajusta com o restante e mede o erro
+# de cada previsor sobre o mesmo lote de séries.
+def avaliar(previsores, datas, Y, horizonte=2):
+    datas = pd.DatetimeIndex(datas)
+    Y = np.asarray(Y, dtype=float)
+    treino, teste = Y[:, :-horizonte], Y[:, -horizonte:]
+
+    linhas = []
+    for previsor in previsores:
+        inicio = time.perf_counter()
+        yhat, _ = previsor.prever_lote(datas[:-horizonte], treino, horizonte)
+        tempo = time.perf_counter() - inicio
+
+        erro = np.abs(yhat[:, -horizonte:] - teste)
+        base = np.abs(teste)
+        linhas.append({
+            "previsor": previsor.nome,
+            "series": len(Y),
+            "tempo_ajuste_s": tempo,
+            "mae": float(np.nanmean(erro)),
+            "mape_%": float(np.nanmean(np.where(base > 0, erro / np.where(base > 0, base, 1), np.nan)) * 100),
+        })
+    return pd.DataFrame(linhas)
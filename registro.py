@@ -0,0 +1,149 @@
+import glob
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import historico
+import pacote
+import streaming
+import variacoes
+from carregamento import cache, carregar
+from historico import extrair_mes_ano, listar_arquivos
+
+# -------------------------
+# CONFIG
+# -------------------------
+# raiz dos dados: partições em <raiz>/<entidade>/<ano>/ com o relatório
+# (Relatorio.txt) e a pasta historico/ de cada entidade e exercício
+PASTA_DADOS = os.environ.get("DASHBOARD_DADOS", "dados")
+ARQUIVO_RELATORIO = "Relatorio.txt"
+PASTA_HISTORICO = "historico"
+# entidade do layout antigo (<raiz>/Relatorio.txt + <raiz>/historico)
+ENTIDADE_PADRAO = os.environ.get("DASHBOARD_ENTIDADE_PADRAO", "Guaramirim")
+# partições sem acesso há mais que isso saem da memória
+OCIOSIDADE_MIN = float(os.environ.get("DASHBOARD_OCIOSIDADE_MIN", "30"))
+# intervalo mínimo entre duas varreduras da raiz
+REDESCOBERTA_S = 30
+
+logger = logging.getLogger(__name__)
+
+# -------------------------
+# PARTIÇÃO (ENTIDADE x ANO)
+# -------------------------
+class Particao:
+    def __init__(self, entidade, ano, pasta):
+        self.entidade = entidade
+        self.ano = ano
+        self.pasta = pasta
+        self.arquivo = os.path.join(pasta, ARQUIVO_RELATORIO)
+        self.pasta_historico = os.path.join(pasta, PASTA_HISTORICO)
+        self.pasta_pacote = pacote.pasta_pacote(self.arquivo)
+        self.catalogo = os.path.join(pasta, ".cache", "catalogo_previsoes.arrow")
+        self.logo = os.path.join(pasta, "logo.png")
+        self.ultimo_acesso = None
+
+    @property
+    def chave(self):
+        return (self.entidade, self.ano)
+
+# ano do layout antigo: o mais recente dos arquivos do histórico
+def _ano_historico(pasta):
+    anos = []
+    for arq in listar_arquivos(pasta):
+        try:
+            anos.append(extrair_mes_ano(arq).year)
+        except ValueError:
+            continue
+    return str(max(anos)) if anos else str(datetime.now().year)
+
+# -------------------------
+# REGISTRO DE PARTIÇÕES
+# -------------------------
+# Descobre as partições na raiz, carrega cada uma só no primeiro acesso
+# (pelo cache de carregamento, compartilhado entre sessões) e tira da
+# memória as que ficarem ociosas. Trocar de entidade/ano não recarrega as
+# outras partições abertas.
+class Registro:
+    def __init__(self, raiz, ociosidade_s):
+        self.raiz = raiz
+        self.ociosidade_s = ociosidade_s
+        self._particoes = {}
+        self._varredura = 0.0
+        self._trava = threading.Lock()
+
+    def _descobrir(self):
+        encontradas = {}
+        for arquivo in sorted(glob.glob(os.path.join(self.raiz, "*", "*", ARQUIVO_RELATORIO))):
+            pasta = os.path.dirname(arquivo)
+            entidade = os.path.basename(os.path.dirname(pasta))
+            ano = os.path.basename(pasta)
+            if ano.isdigit() and not entidade.startswith("."):
+                encontradas[(entidade, ano)] = Particao(entidade, ano, pasta)
+
+        legado = os.path.join(self.raiz, ARQUIVO_RELATORIO)
+        if os.path.exists(legado):
+            ano = _ano_historico(os.path.join(self.raiz, PASTA_HISTORICO))
+            encontradas.setdefault((ENTIDADE_PADRAO, ano), Particao(ENTIDADE_PADRAO, ano, self.raiz))
+        return encontradas
+
+    def particoes(self):
+        with self._trava:
+            if time.monotonic() - self._varredura < REDESCOBERTA_S:
+                return dict(self._particoes)
+        encontradas = self._descobrir()
+        with self._trava:
+            # mantém os objetos já conhecidos (com seus horários de acesso)
+            self._particoes = {k: self._particoes.get(k, p) for k, p in encontradas.items()}
+            self._varredura = time.monotonic()
+            return dict(self._particoes)
+
+    def entidades(self):
+        return sorted({entidade for entidade, _ in self.particoes()})
+
+    def anos(self, entidade):
+        return sorted((ano for e, ano in self.particoes() if e == entidade), reverse=True)
+
+    def particao(self, entidade, ano):
+        return self.particoes().get((entidade, ano))
+
+    # DataFrame do relatório da partição (lido no primeiro acesso)
+    def carregar(self, particao):
+        self.marcar_acesso(particao)
+        df = carregar(particao.arquivo)
+        self.despejar_ociosas()
+        return df
+
+    # modo arquivo grande: só os agregados do relatório, lidos em blocos
+    def agregar(self, particao, progresso=None):
+        self.marcar_acesso(particao)
+        agregados = streaming.obter_agregados(particao.arquivo, progresso)
+        self.despejar_ociosas()
+        return agregados
+
+    def marcar_acesso(self, particao):
+        with self._trava:
+            particao.ultimo_acesso = time.monotonic()
+
+    def despejar_ociosas(self):
+        limite = time.monotonic() - self.ociosidade_s
+        with self._trava:
+            ociosas = [p for p in self._particoes.values() if p.ultimo_acesso is not None and p.ultimo_acesso < limite]
+            for p in ociosas:
+                p.ultimo_acesso = None
+        for p in ociosas:
+            logger.info("Partição %s/%s ociosa: liberada da memória", p.entidade, p.ano)
+            cache.invalidar(p.arquivo)
+            streaming.descartar(p.arquivo)
+            historico.descartar(p.pasta_historico)
+            variacoes.descartar(p.pasta_historico)
+            pacote.descartar(p.pasta_pacote)
+        return [p.chave for p in ociosas]
+
+    def abertas(self):
+        with self._trava:
+            return [p.chave for p in self._particoes.values() if p.ultimo_acesso is not None]
+
+
+registro = Registro(PASTA_DADOS, OCIOSIDADE_MIN * 60)
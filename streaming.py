@@ -0,0 +1,222 @@
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+import carregamento
+from carregamento import FORMATO_NUMERICO, NUMERIC_COLS, CacheDataFrames, converter_numericos, detectar_formato, find_col, mapear_colunas
+from consultas import ConsultasPandas
+from cubo import Cubo
+from desempenho import medir
+
+# -------------------------
+# CONFIG
+# -------------------------
+# exportações a partir deste tamanho são lidas em blocos (modo arquivo
+# grande): só os agregados ficam em memória, não as linhas
+MODO_GRANDE_MB = float(os.environ.get("DASHBOARD_MODO_GRANDE_MB", "1024"))
+# linhas por bloco do read_csv
+LINHAS_BLOCO = int(os.environ.get("DASHBOARD_LINHAS_BLOCO", "200000"))
+# parciais acumuladas (linhas) antes de serem consolidadas em uma só
+LIMITE_PARCIAIS = 500_000
+
+DIMENSOES_CUBO = ["funcao descricao", "subfuncao descricao", "descricao categoria economica"]
+
+logger = logging.getLogger(__name__)
+
+# estimativa para o progresso: bytes por linha no primeiro MB do arquivo
+def _bytes_por_linha(caminho):
+    with open(caminho, "rb") as f:
+        amostra = f.read(1 << 20)
+    return len(amostra) / max(amostra.count(b"\n"), 1)
+
+def arquivo_grande(caminho):
+    try:
+        return os.path.getsize(caminho) >= MODO_GRANDE_MB * 2**20
+    except OSError:
+        return False
+
+# -------------------------
+# LEITURA EM BLOCOS
+# -------------------------
+# Lê o cabeçalho, mapeia as colunas e então percorre o arquivo em blocos
+# de `linhas_bloco` linhas, só com as colunas pedidas (nomes normalizados)
+# e os valores já convertidos. O formato numérico é decidido no primeiro
+# bloco com texto e vale para o arquivo inteiro. Gera (bloco, expected).
+def ler_em_blocos(caminho, colunas, linhas_bloco=None, estatisticas=None):
+    opcoes = {"sep": ";", "encoding": "latin1", "quotechar": '"'}
+    cabecalho = pd.read_csv(caminho, nrows=0, **opcoes).columns
+    nomes = [c.strip() for c in cabecalho]
+    expected = mapear_colunas(nomes)
+    # colunas fora de EXPECTED_COLS (ex.: ação, fonte do histórico)
+    expected.update({n: find_col(nomes, n) for n in colunas if expected.get(n) is None})
+    originais = {c.strip(): c for c in cabecalho}
+    usadas = [expected.get(n) for n in colunas if expected.get(n)]
+    valores = [expected.get(n) for n in NUMERIC_COLS if expected.get(n) in usadas]
+    textos = [c for c in usadas if c not in valores]
+
+    formato = None if FORMATO_NUMERICO == "auto" else FORMATO_NUMERICO
+    estatisticas = estatisticas if estatisticas is not None else {}
+    estatisticas.setdefault("rejeitados", {})
+
+    leitor = pd.read_csv(
+        caminho, usecols=[originais[c] for c in usadas], dtype={originais[c]: str for c in textos},
+        chunksize=linhas_bloco or LINHAS_BLOCO, **opcoes,
+    )
+    with leitor:
+        for bloco in leitor:
+            bloco.columns = [c.strip() for c in bloco.columns]
+            if formato is None:
+                texto = [c for c in valores if not pd.api.types.is_numeric_dtype(bloco[c].dtype)]
+                if texto:
+                    amostra = pd.Series(bloco[texto].to_numpy().ravel()).dropna().astype(str).str.strip()
+                    formato = detectar_formato(amostra)
+            bloco, rejeitados = converter_numericos(bloco, expected, formato or "ponto")
+            for c, n in rejeitados.items():
+                estatisticas["rejeitados"][c] = estatisticas["rejeitados"].get(c, 0) + n
+            for c in textos:
+                bloco[c] = bloco[c].str.strip()
+            yield bloco, expected
+
+# -------------------------
+# AGREGADOS INCREMENTAIS
+# -------------------------
+# Soma das medidas por chave, alimentada bloco a bloco: cada bloco vira uma
+# parcial agregada; as parciais são consolidadas quando passam de
+# LIMITE_PARCIAIS linhas. A memória fica limitada ao número de combinações
+# distintas das chaves, não ao de linhas do arquivo.
+class Acumulador:
+    def __init__(self, chaves, medidas):
+        self.chaves = list(chaves)
+        self.medidas = list(medidas)
+        self._parciais = []
+        self._linhas = 0
+
+    def _agrupar(self, df):
+        if not self.chaves:
+            return df[self.medidas].sum().to_frame().T
+        return df.groupby(self.chaves, dropna=False, observed=True, sort=False)[self.medidas].sum().reset_index()
+
+    def adicionar(self, df, agregado=False):
+        parcial = df if agregado else self._agrupar(df)
+        self._parciais.append(parcial)
+        self._linhas += len(parcial)
+        if self._linhas > LIMITE_PARCIAIS and len(self._parciais) > 1:
+            self._consolidar()
+
+    def _consolidar(self):
+        if len(self._parciais) > 1:
+            self._parciais = [self._agrupar(pd.concat(self._parciais, ignore_index=True))]
+        self._linhas = sum(len(p) for p in self._parciais)
+
+    def resultado(self):
+        if not self._parciais:
+            return pd.DataFrame(columns=self.chaves + self.medidas)
+        self._consolidar()
+        return self._parciais[0]
+
+# -------------------------
+# RELATÓRIO EM MODO ARQUIVO GRANDE
+# -------------------------
+# Cubo (função x subfunção x categoria) calculado em uma passada pelo
+# arquivo, com vazão por bloco. `progresso(fracao)` é chamado a cada bloco.
+class AgregadosArquivo:
+    def __init__(self, caminho, linhas_bloco=None, progresso=None):
+        self.caminho = os.path.abspath(caminho)
+        tamanho = os.path.getsize(caminho)
+        inicio = time.perf_counter()
+        estatisticas = {}
+        acumulador = None
+        bytes_linha = _bytes_por_linha(caminho)
+        anterior = inicio
+        self.blocos = []
+
+        for bloco, expected in ler_em_blocos(caminho, DIMENSOES_CUBO + NUMERIC_COLS, linhas_bloco, estatisticas):
+            if acumulador is None:
+                self.expected = expected
+                dims = [expected.get(n) for n in DIMENSOES_CUBO if expected.get(n)]
+                medidas = [expected.get(n) for n in NUMERIC_COLS if expected.get(n)]
+                acumulador = Acumulador(dims, medidas)
+            acumulador.adicionar(bloco)
+            agora = time.perf_counter()
+            # leitura + conversão + agregação do bloco
+            self.blocos.append({"linhas": len(bloco), "segundos": agora - anterior, "linhas_s": len(bloco) / max(agora - anterior, 1e-9)})
+            anterior = agora
+            if progresso is not None:
+                progresso(min(sum(b["linhas"] for b in self.blocos) * bytes_linha / tamanho, 1.0))
+
+        if acumulador is None:
+            raise ValueError(f"{caminho}: arquivo sem linhas")
+        self.cubo = Cubo(acumulador.resultado(), acumulador.chaves, acumulador.medidas)
+        self.consultas = ConsultasPandas(None, self.cubo.dimensoes, self.cubo.medidas, self.expected.get("funcao descricao"), cubo=self.cubo)
+        carregamento.rejeitados[self.caminho] = estatisticas["rejeitados"]
+        if estatisticas["rejeitados"]:
+            logger.warning("%s: células numéricas rejeitadas %s", caminho, estatisticas["rejeitados"])
+
+        segundos = time.perf_counter() - inicio
+        linhas = sum(b["linhas"] for b in self.blocos)
+        self.vazao = {
+            "blocos": len(self.blocos),
+            "linhas": linhas,
+            "bytes": tamanho,
+            "segundos": segundos,
+            "linhas_s": linhas / segundos if segundos else float("nan"),
+            "mb_s": tamanho / 2**20 / segundos if segundos else float("nan"),
+            "celulas": len(self.cubo.celulas),
+        }
+        logger.info(
+            "%s: %d linhas em %d blocos, %.1fs (%.0f linhas/s, %.1f MB/s), %d células",
+            caminho, linhas, len(self.blocos), segundos, self.vazao["linhas_s"], self.vazao["mb_s"], self.vazao["celulas"],
+        )
+
+
+_agregados = {}  # caminho -> (assinatura, AgregadosArquivo)
+_travas = {}
+_trava = threading.Lock()
+
+# Agregados do arquivo (uma leitura em blocos por versão do arquivo,
+# compartilhada entre sessões)
+def obter_agregados(caminho, progresso=None, aceitar_antigo=None):
+    caminho = os.path.abspath(caminho)
+    assinatura = CacheDataFrames.assinatura(caminho)
+    if aceitar_antigo is None:
+        aceitar_antigo = carregamento.cache.renovacao_externa
+    with _trava:
+        item = _agregados.get(caminho)
+        # com o vigia ligado, a versão anterior vale até ele terminar a nova
+        if item is not None and (item[0] == assinatura or aceitar_antigo):
+            return item[1]
+        trava = _travas.setdefault(caminho, threading.Lock())
+
+    # sessões concorrentes esperam a mesma leitura
+    with trava:
+        with _trava:
+            item = _agregados.get(caminho)
+            if item is not None and item[0] == assinatura:
+                return item[1]
+        with medir("leitura em blocos") as m:
+            agregados = AgregadosArquivo(caminho, progresso=progresso)
+            m["linhas"] = agregados.vazao["linhas"]
+        with _trava:
+            _agregados[caminho] = (assinatura, agregados)
+    return agregados
+
+def descartar(caminho):
+    with _trava:
+        _agregados.pop(os.path.abspath(caminho), None)
+
+# -------------------------
+# HISTÓRICO
+# -------------------------
+# agregar_mes aplicado bloco a bloco; as parciais (já agregadas) somam
+def agregar_em_blocos(caminho, agregar, chaves, medidas, colunas, linhas_bloco=None):
+    acumulador = Acumulador(chaves, medidas)
+    vazio = True
+    for bloco, _ in ler_em_blocos(caminho, colunas, linhas_bloco):
+        parcial = agregar(bloco)
+        if parcial is not None:
+            acumulador.adicionar(parcial, agregado=True)
+            vazio = False
+    return None if vazio else acumulador.resultado()
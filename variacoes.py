@@ -0,0 +1,178 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from historico import DIMENSOES
+
+# -------------------------
+# CONFIG
+# -------------------------
+# métrica -> (coluna acumulada "até o mês", coluna informada "no mês")
+METRICAS = {
+    "empenhado": ("empenhado ate o mes", "empenhado no mes"),
+    "liquidado": ("liquidado ate o mes", "liquidado no mes"),
+    "pago": ("pago ate o mes", "pago no mes"),
+}
+
+NOMES_NIVEIS = {
+    "funcao": "Função",
+    "subfuncao": "Subfunção",
+    "categoria": "Categoria Econômica",
+    "programa": "Programa",
+    "acao": "Ação",
+    "fonte": "Fonte",
+}
+
+UM_MES = pd.offsets.MonthBegin(1)
+UM_ANO = pd.offsets.MonthBegin(12)
+
+# -------------------------
+# FLUXOS E VARIAÇÕES
+# -------------------------
+# Tudo por junções vetorizadas da tabela longa com ela mesma deslocada
+# de 1 mês (fluxo e MoM) e de 12 meses (YoY); `meses` limita o cálculo
+# aos meses pedidos (os demais só servem de referência).
+def agregar_nivel(tabela, nivel, metrica):
+    acumulado, informado = METRICAS[metrica]
+    agregado = tabela.groupby(["mes"] + list(nivel), dropna=False, observed=True, sort=False)[[acumulado, informado]].sum()
+    return agregado.reset_index().rename(columns={acumulado: "acumulado", informado: "informado"})
+
+def _deslocado(tabela, chaves, colunas, deslocamento, sufixo):
+    ref = tabela[chaves + colunas].copy()
+    ref["mes"] = ref["mes"] + deslocamento
+    return ref.rename(columns={c: f"{c}_{sufixo}" for c in colunas})
+
+def _percentual(diferenca, base):
+    base = np.asarray(base, dtype=float)
+    return np.where(np.abs(base) > 0, np.asarray(diferenca, dtype=float) / np.where(base == 0, 1, np.abs(base)) * 100, np.nan)
+
+# Fluxo do mês = acumulado do mês - acumulado do mês anterior (no mesmo
+# exercício; em janeiro o fluxo é o próprio acumulado). Sem o mês anterior
+# no histórico, vale o valor "no mês" informado no arquivo.
+def calcular_fluxos(agregado, nivel, meses=None):
+    chaves = ["mes"] + list(nivel)
+    alvo = agregado if meses is None else agregado[agregado["mes"].isin(meses)]
+    r = alvo.merge(_deslocado(agregado, chaves, ["acumulado"], UM_MES, "anterior"), on=chaves, how="left")
+
+    presentes = pd.DatetimeIndex(agregado["mes"].unique())
+    tem_anterior = (r["mes"] - UM_MES).isin(presentes).to_numpy()
+    janeiro = (r["mes"].dt.month == 1).to_numpy()
+    anterior = r["acumulado_anterior"].fillna(0).to_numpy()
+    r["fluxo"] = np.where(
+        janeiro, r["acumulado"],
+        np.where(tem_anterior, r["acumulado"].to_numpy() - anterior, r["informado"]),
+    )
+    return r.drop(columns="acumulado_anterior")
+
+# MoM: fluxo contra o do mês anterior; YoY: fluxo e acumulado contra o
+# mesmo mês do ano anterior
+def calcular_variacoes(fluxos, nivel, meses=None):
+    chaves = ["mes"] + list(nivel)
+    alvo = fluxos if meses is None else fluxos[fluxos["mes"].isin(meses)]
+    r = alvo.merge(_deslocado(fluxos, chaves, ["fluxo"], UM_MES, "mes_anterior"), on=chaves, how="left")
+    r = r.merge(_deslocado(fluxos, chaves, ["fluxo", "acumulado"], UM_ANO, "ano_anterior"), on=chaves, how="left")
+
+    r["variacao_mom"] = r["fluxo"] - r["fluxo_mes_anterior"]
+    r["variacao_mom_%"] = _percentual(r["variacao_mom"], r["fluxo_mes_anterior"])
+    r["variacao_yoy"] = r["fluxo"] - r["fluxo_ano_anterior"]
+    r["variacao_yoy_%"] = _percentual(r["variacao_yoy"], r["fluxo_ano_anterior"])
+    r["acumulado_yoy_%"] = _percentual(r["acumulado"] - r["acumulado_ano_anterior"], r["acumulado_ano_anterior"])
+    return r
+
+# -------------------------
+# MOTOR INCREMENTAL
+# -------------------------
+# Guarda agregado, fluxos e variações de um nível/métrica. A cada nova
+# versão do histórico, só os meses novos/alterados são reagregados; fluxos
+# são refeitos para eles e o mês seguinte, variações também para o mês
+# seguinte e o mesmo mês do ano seguinte. O resto é reaproveitado.
+class MotorVariacoes:
+    def __init__(self, nivel, metrica):
+        self.nivel = list(nivel)
+        self.metrica = metrica
+        self.impressoes = {}
+        self.agregado = None
+        self.fluxos = None
+        self.resultado = None
+        self._tabela = None
+        self._trava = threading.Lock()
+
+    @staticmethod
+    def _impressoes(tabela):
+        hashes = pd.util.hash_pandas_object(tabela, index=False).to_numpy()
+        por_mes = pd.Series(hashes).groupby(tabela["mes"].to_numpy()).agg(["sum", "size"])
+        return {pd.Timestamp(m): (int(h), int(n)) for m, h, n in zip(por_mes.index, por_mes["sum"], por_mes["size"])}
+
+    @staticmethod
+    def _vizinhos(meses, presentes, deslocamentos):
+        return {m + d for m in meses for d in deslocamentos} & presentes
+
+    @staticmethod
+    def _trocar(antigo, novo, meses):
+        if antigo is None:
+            return novo
+        return pd.concat([antigo[~antigo["mes"].isin(meses)], novo], ignore_index=True)
+
+    def atualizar(self, tabela):
+        with self._trava:
+            if tabela is self._tabela:
+                return self.resultado
+
+            impressoes = self._impressoes(tabela)
+            alterados = {m for m, h in impressoes.items() if self.impressoes.get(m) != h}
+            removidos = set(self.impressoes) - set(impressoes)
+            presentes = set(impressoes)
+
+            if alterados or removidos or self.resultado is None:
+                novo = agregar_nivel(tabela[tabela["mes"].isin(alterados)], self.nivel, self.metrica)
+                self.agregado = self._trocar(self.agregado, novo, alterados | removidos)
+
+                meses_fluxo = alterados | self._vizinhos(alterados | removidos, presentes, [UM_MES])
+                novo = calcular_fluxos(self.agregado, self.nivel, meses_fluxo)
+                self.fluxos = self._trocar(self.fluxos, novo, meses_fluxo | removidos)
+
+                meses_var = meses_fluxo | self._vizinhos(meses_fluxo | removidos, presentes, [UM_MES, UM_ANO])
+                novo = calcular_variacoes(self.fluxos, self.nivel, meses_var)
+                self.resultado = self._trocar(self.resultado, novo, meses_var | removidos).sort_values(
+                    ["mes"] + self.nivel, ignore_index=True
+                )
+
+            self.impressoes = impressoes
+            self._tabela = tabela
+            return self.resultado
+
+
+_motores = {}
+_trava = threading.Lock()
+
+# Variações por nível (lista de dimensões; vazia = total) para a métrica.
+# Com `origem` (ex.: pasta do histórico), o motor é mantido entre chamadas
+# e atualizado de forma incremental; sem ela, calcula tudo de uma vez.
+def variacoes(tabela, nivel=(), metrica="pago", origem=None):
+    nivel = [d for d in nivel if d in DIMENSOES]
+    if origem is None:
+        agregado = agregar_nivel(tabela, nivel, metrica)
+        return calcular_variacoes(calcular_fluxos(agregado, nivel), nivel)
+
+    chave = (origem, tuple(nivel), metrica)
+    with _trava:
+        motor = _motores.get(chave)
+        if motor is None:
+            motor = _motores[chave] = MotorVariacoes(nivel, metrica)
+    return motor.atualizar(tabela)
+
+# libera os motores de uma origem (partição ociosa: registro.py)
+def descartar(origem):
+    with _trava:
+        for chave in [c for c in _motores if c[0] == origem]:
+            del _motores[chave]
+
+# série mensal de fluxos (ds, y) para previsão: sem os degraus do
+# acumulado, que volta a zero a cada exercício
+def serie_fluxo(tabela, metrica="pago", filtro=None, origem=None):
+    dados = tabela
+    for dim, valor in (filtro or {}).items():
+        dados = dados[dados[dim] == valor]
+    total = variacoes(dados, (), metrica, origem if not filtro else None)
+    return total[["mes", "fluxo"]].rename(columns={"mes": "ds", "fluxo": "y"})
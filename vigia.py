@@ -0,0 +1,180 @@
+import logging
+import os
+import threading
+import time
+
+from anomalias import NIVEL_PADRAO
+from carregamento import CacheDataFrames, cache, mapear_colunas
+from consultas import obter_consultas
+from cubo import obter_indice
+from detalhes import obter_tabela
+from historico import ler_historico, listar_arquivos
+from pacote import abrir_pacote, gerar_pacote
+from previsao import gerar_catalogo
+from streaming import arquivo_grande, obter_agregados
+from variacoes import variacoes
+
+# -------------------------
+# CONFIG
+# -------------------------
+# intervalo entre duas varreduras das pastas das partições (0 = desligado)
+INTERVALO_VIGIA_S = float(os.environ.get("DASHBOARD_VIGIA_S", "10"))
+
+DIMENSOES_FILTROS = ["funcao descricao", "subfuncao descricao", "descricao categoria economica"]
+
+logger = logging.getLogger(__name__)
+
+# -------------------------
+# VIGIA DE ARQUIVOS (POLLING)
+# -------------------------
+# Thread que, a cada intervalo, confere tamanho/mtime do relatório e dos
+# arquivos do histórico das partições abertas. Quando algo muda (e fica
+# igual por uma varredura inteira, para não pegar arquivo pela metade),
+# relê tudo o que a tela usa — DataFrame, índice dos filtros, consultas,
+# tabela detalhada, histórico, variações, previsões e, se houver, o pacote —
+# e cada cache troca a versão de uma vez. Enquanto isso, as sessões seguem
+# recebendo a versão anterior (renovacao_externa nos caches).
+class Vigia:
+    def __init__(self, registro, intervalo):
+        self.registro = registro
+        self.intervalo = intervalo
+        self.renovacoes = {}  # partição -> resumo da última renovação
+        self._vistas = {}     # partição -> assinaturas já renovadas
+        self._candidatas = {} # partição -> assinaturas da varredura anterior
+        self._parar = threading.Event()
+        self._thread = None
+        self._trava = threading.Lock()
+
+    @property
+    def ativo(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def iniciar(self):
+        with self._trava:
+            if self.intervalo <= 0 or self.ativo:
+                return False
+            cache.renovacao_externa = True
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._rodar, name="vigia-arquivos", daemon=True)
+            self._thread.start()
+        logger.info("Vigia de arquivos ligado (a cada %.0fs)", self.intervalo)
+        return True
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+        cache.renovacao_externa = False
+
+    def _rodar(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.verificar()
+            except Exception:
+                logger.exception("Vigia de arquivos: falha na varredura")
+
+    @staticmethod
+    def _assinaturas(particao):
+        assinaturas = {}
+        for arq in [particao.arquivo] + listar_arquivos(particao.pasta_historico):
+            try:
+                assinaturas[arq] = CacheDataFrames.assinatura(arq)
+            except OSError:
+                continue
+        return assinaturas
+
+    # uma varredura; devolve as partições renovadas
+    def verificar(self):
+        renovadas = []
+        for chave, particao in self.registro.particoes().items():
+            # só as partições em uso: as outras são lidas no primeiro acesso
+            if particao.ultimo_acesso is None:
+                continue
+            assinaturas = self._assinaturas(particao)
+            if assinaturas == self._vistas.get(chave):
+                continue
+            if assinaturas != self._candidatas.get(chave):
+                self._candidatas[chave] = assinaturas
+                continue
+            self.renovar(particao)
+            self._vistas[chave] = assinaturas
+            renovadas.append(chave)
+        return renovadas
+
+    def renovar(self, particao):
+        inicio = time.perf_counter()
+        etapas = {}
+        erros = []
+
+        def etapa(nome, funcao):
+            comeco = time.perf_counter()
+            try:
+                return funcao()
+            except Exception as e:
+                logger.exception("Vigia de arquivos: falha em %s (%s/%s)", nome, particao.entidade, particao.ano)
+                erros.append((nome, str(e)))
+            finally:
+                etapas[nome] = time.perf_counter() - comeco
+
+        # relatório: mesmas estruturas (e mesmos argumentos) que o app pede
+        if os.path.exists(particao.arquivo):
+            if arquivo_grande(particao.arquivo):
+                agregados = etapa("relatório", lambda: obter_agregados(particao.arquivo, aceitar_antigo=False))
+                if agregados is not None:
+                    colunas = [agregados.expected.get(n) for n in DIMENSOES_FILTROS]
+                    etapa("filtros", lambda: obter_indice(agregados.cubo.celulas, colunas))
+            else:
+                df = etapa("relatório", lambda: cache.obter(particao.arquivo, aceitar_antigo=False))
+                if df is not None:
+                    expected = mapear_colunas(df.columns)
+                    colunas = [expected.get(n) for n in DIMENSOES_FILTROS]
+                    etapa("filtros", lambda: obter_indice(df, colunas))
+                    etapa("consultas", lambda: obter_consultas(df, particao.arquivo, expected))
+                    etapa("tabela detalhada", lambda: obter_tabela(df))
+
+        # histórico: tabela longa, variações/anomalias da tela e previsões
+        if listar_arquivos(particao.pasta_historico):
+            resultado = etapa("histórico", lambda: ler_historico(particao.pasta_historico, aceitar_antigo=False))
+            if resultado is not None:
+                tabela, erros_historico = resultado
+                erros.extend(("histórico", f"{arq}: {e}") for arq, e in erros_historico)
+                origem = particao.pasta_historico
+                etapa("variações", lambda: [variacoes(tabela, nivel, "pago", origem) for nivel in [(), NIVEL_PADRAO]])
+                etapa("previsões", lambda: gerar_catalogo(tabela, destino=particao.catalogo))
+
+        # pacote pré-calculado: se a partição usa um, gera o da nova versão
+        pacote = abrir_pacote(particao.pasta_pacote)
+        if pacote is not None and not pacote.confere(particao.arquivo, particao.pasta_historico):
+            etapa("pacote", lambda: gerar_pacote(particao.arquivo, particao.pasta_historico))
+
+        resumo = {
+            "quando": time.time(),
+            "segundos": time.perf_counter() - inicio,
+            "etapas": etapas,
+            "erros": erros,
+        }
+        with self._trava:
+            self.renovacoes[particao.chave] = resumo
+        logger.info(
+            "Vigia de arquivos: %s/%s renovada em %.1fs (%s)", particao.entidade, particao.ano, resumo["segundos"],
+            ", ".join(f"{k}={v:.1f}s" for k, v in etapas.items()),
+        )
+        return resumo
+
+    def ultima_renovacao(self, chave):
+        with self._trava:
+            return self.renovacoes.get(chave)
+
+
+_vigia = None
+_trava = threading.Lock()
+
+# vigia único por processo (o servidor do Streamlit), ligado na primeira
+# execução do app
+def iniciar_vigia(registro):
+    global _vigia
+    with _trava:
+        if _vigia is None:
+            _vigia = Vigia(registro, INTERVALO_VIGIA_S)
+    _vigia.iniciar()
+    return _vigia